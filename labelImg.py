@@ -27,6 +27,14 @@ from libs.shape import Shape, DEFAULT_LINE_COLOR, DEFAULT_FILL_COLOR
 from libs.toolBar import ToolBar
 from libs.zoomWidget import ZoomWidget
 from libs.ImageManagement import loadImageThread,loadOnlineImgMul
+from libs.imageCache import ImagePrefetcher, ImageLoader
+from libs.imageList import ImageList
+from libs.imageScanner import ImageScanner
+from libs.imageManifest import ImageManifest, manifestPath
+from libs.fileListModel import FileListModel
+from libs.tileCache import TilePyramid, needsTiles, canDecodeRegions
+from libs.saveQueue import SaveQueue
+from libs.editJournal import EditJournal
 from libs.SettingDialog import SettingDialog
 from libs.save_mask_image import label_mask_writer
 import resources
@@ -90,7 +98,11 @@ class MainWindow(QMainWindow, WindowMixin):
         if self.usingPascalVocFormat:
             LabelFile.suffix = '.xml'
         # For loading all image under a directory
-        self.mImgList = []
+        self.mImgList = ImageList()
+        # Position of the current image in mImgList
+        self.currIndex = None
+        self.imageScanner = None
+        self.manifest = None
         self.dirname = None
         self.image_size = []
         self.labelHist = []
@@ -98,6 +110,25 @@ class MainWindow(QMainWindow, WindowMixin):
         self.label_sub_dic = {}
         self.label_num_dic = {}
         self.lastOpenDir = None
+        # Images are first decoded at screen size, and at full resolution
+        # only once zoomed in past that.
+        self.previewSize = QApplication.desktop().screenGeometry().size()
+        self.upgradePending = None
+        # Decode-ahead cache for the images around the current one
+        self.prefetcher = ImagePrefetcher(maxSize=self.previewSize)
+        # Reads and decodes images off the GUI thread
+        self.imageLoader = ImageLoader()
+        self.imageLoader.imageLoaded.connect(self.imageLoaded)
+        # Annotations saved on navigation are written in the background.
+        self.saveQueue = SaveQueue(self)
+        self.saveQueue.saved.connect(self.labelsSaved)
+        self.saveQueue.saveFailed.connect(self.labelsSaveFailed)
+        # Edits not saved yet, replayed after a crash.
+        self.journal = EditJournal(
+            os.path.join(os.path.expanduser('~'), '.labelImgJournal'))
+        self.journalTimer = QTimer(self)
+        self.journalTimer.timeout.connect(self.journal.flush)
+        self.journalTimer.start(1000)
         date = time.strftime('%Y_%m_%d_%H', time.localtime(time.time()))
         self.loadFilePath = 'database/pics/' + date + '/'
 
@@ -142,8 +173,12 @@ class MainWindow(QMainWindow, WindowMixin):
         self.dock.setObjectName(u'Labels')
         self.dock.setWidget(self.labelListContainer)
         # add file list add dock to move faster
-        self.fileListWidget = QListWidget()
-        self.fileListWidget.itemDoubleClicked.connect(
+        self.fileListModel = FileListModel(self.mImgList)
+        self.fileListWidget = QListView()
+        self.fileListWidget.setModel(self.fileListModel)
+        self.fileListWidget.setUniformItemSizes(True)
+        self.fileListWidget.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.fileListWidget.doubleClicked.connect(
             self.fileitemDoubleClicked)
         filelistLayout = QVBoxLayout()
         filelistLayout.setContentsMargins(0, 0, 0, 0)
@@ -183,6 +218,7 @@ class MainWindow(QMainWindow, WindowMixin):
 
         self.canvas.newShape.connect(self.newShape)
         self.canvas.shapeMoved.connect(self.setDirty)
+        self.canvas.shapeMoved.connect(self.journalMove)
         self.canvas.selectionChanged.connect(self.shapeSelectionChanged)
         self.canvas.drawingPolygon.connect(self.toggleDrawingSensitive)
 
@@ -579,7 +615,11 @@ class MainWindow(QMainWindow, WindowMixin):
         self.updateFileMenu()
         # Since loading the file may take some time, make sure it runs in the
         # background.
-        self.queueEvent(partial(self.loadFile, self.filename))
+        recovered = self.journal.recover()
+        if recovered:
+            self.queueEvent(partial(self.recoverJournal, recovered))
+        else:
+            self.queueEvent(partial(self.loadFile, self.filename))
         self.queueEvent(partial(self.load_label_color_map))
         if self.has_defined_color_map and len(
                 self.label_color_map) < len(
@@ -593,6 +633,8 @@ class MainWindow(QMainWindow, WindowMixin):
     # infomation display
     def info_display(self):
         self.dowload_image_num = len(self.mImgList)
+        # Show the images appended by the download threads.
+        self.fileListModel.sync()
         info = 'server image num:\t' + str(self.server_image_num) + '\n' \
                + 'dowload image num:\t' + str(self.dowload_image_num) + '\n' \
                + 'precessed image num:\t' + str(self.process_image_num)
@@ -674,8 +716,8 @@ class MainWindow(QMainWindow, WindowMixin):
         for item in self.actions.remote_mode:
             item.setEnabled(True)
 
-    def fileitemDoubleClicked(self, item=None):
-        currIndex = self.mImgList.index(str(item.text()))
+    def fileitemDoubleClicked(self, index=None):
+        currIndex = index.row()
         if currIndex < len(self.mImgList):
             filename = self.mImgList[currIndex]
             if filename:
@@ -726,14 +768,44 @@ class MainWindow(QMainWindow, WindowMixin):
     def status(self, message, delay=5000):
         self.statusBar().showMessage(message, delay)
 
+    def recoverJournal(self, images):
+        yes, no = QMessageBox.Yes, QMessageBox.No
+        msg = u'Unsaved changes to %d image(s) were left by the last ' \
+              u'session, the latest to %s. Recover them?' % (
+                  len(images), os.path.basename(images[-1]))
+        if yes == QMessageBox.question(self, u'Recover', msg, yes | no):
+            self.journal.restore()
+            # The settings holding the save folder are only written on
+            # exit; save where the recovered annotations were.
+            self.defaultSaveDir = os.path.join(os.path.dirname(
+                self.journal.recoveredXml(images[-1])), '')
+            self.loadFile(images[-1])
+        else:
+            self.journal.discardRecovered()
+            self.loadFile(self.filename)
+
+    def journalMove(self):
+        canvas = self.canvas
+        self.journal.move(canvas.hShape if canvas.selectedVertex()
+                          else canvas.selectedShape)
+
     def resetState(self):
+        self.journal.endSession()
         self.itemsToShapes.clear()
         self.shapesToItems.clear()
         self.labelList.clear()
         self.filename = None
+        self.currIndex = None
+        self.image = QImage()
         self.imageData = None
+        self.upgradePending = None
         self.labelFile = None
+        self.imageLoader.cancel()
         self.canvas.resetState()
+        # Nothing to save until the next image has loaded: Save would
+        # otherwise stay enabled with no image while it is decoded.
+        self.dirty = False
+        self.actions.save.setEnabled(False)
 
     def currentItem(self):
         items = self.labelList.selectedItems()
@@ -858,6 +930,7 @@ class MainWindow(QMainWindow, WindowMixin):
         self.labelList.addItem(item)
         for action in self.actions.onShapesPresent:
             action.setEnabled(True)
+        self.journal.add(shape)
 
     def remLabel(self, shape):
         item = self.shapesToItems[shape]
@@ -865,13 +938,13 @@ class MainWindow(QMainWindow, WindowMixin):
         temp = None
         del self.shapesToItems[shape]
         del self.itemsToShapes[item]
+        self.journal.delete(shape)
 
     def loadLabels(self, shapes):
         s = []
         for label, points, line_color, fill_color, shape_type in shapes:
             shape = Shape(label=label, shape_type=shape_type)
-            for x, y in points:
-                shape.addPoint(QPointF(x, y))
+            shape.coords = points
             shape.close()
             if self.enable_color_map:
                 if label in self.labelHist:
@@ -886,7 +959,7 @@ class MainWindow(QMainWindow, WindowMixin):
                     shape.fill_color = QColor(*fill_color)
         self.canvas.loadShapes(s)
 
-    def saveLabels(self, filename):
+    def saveLabels(self, filename, background=False):
         lf = LabelFile()
 
         def format_shape(s):
@@ -895,35 +968,37 @@ class MainWindow(QMainWindow, WindowMixin):
                     s.label),
                 line_color=s.line_color.getRgb() if s.line_color != self.lineColor else None,
                 fill_color=s.fill_color.getRgb() if s.fill_color != self.fillColor else None,
-                points=[
-                    (p.x(),
-                     p.y()) for p in s.points],
+                points=map(tuple, s.coords.tolist()),
                 shape_type=s.shape_type)
 
         shapes = [format_shape(shape) for shape in self.canvas.shapes]
         print 'shape type', self.shape_type
         imgFileName = os.path.basename(self.filename)
-        if self.shape_type == 'POLYGON':
-            with open(self.defaultSaveDir + 'label_num_dic.json', 'w') as label_num_file:
-                for key in self.label_num_dic:
-                    print type(key)
-                json.dump(self.label_num_dic, label_num_file)
-            # the mask image will be save as file_mask.jpg etc.
-            result_path = self.defaultSaveDir + \
-                imgFileName.replace('.', '_mask.').split('.')[0] + '.png'
-            mask_writer = label_mask_writer(
-                self.label_num_dic, result_path, self.image_size[1], self.image_size[0])
-            mask_writer.save_mask_image(shapes)
         # Can add differrent annotation formats here
         try:
             if self.usingPascalVocFormat is True:
                 savefilename = self.defaultSaveDir + imgFileName.split('.')[
                     0] + '.xml'  # the mask image will be save as file_mask.jpg etc.
                 print 'savePascalVocFormat save to:' + savefilename
-                lf.savePascalVocFormat(
-                    savefilename, self.image_size, shapes, unicode(
-                        self.filename), shape_type_=self.shape_type)
+                # Everything the writer needs is copied, so that it can
+                # run in the save queue while the user moves on.
+                job = partial(
+                    self.writePascalVoc, savefilename, unicode(self.filename),
+                    list(self.image_size), shapes, self.shape_type,
+                    dict(self.label_num_dic), self.defaultSaveDir)
+                if background:
+                    self.saveQueue.submit(savefilename, job)
+                    self.journal.saving(savefilename)
+                else:
+                    # Let the queue finish first: it may be writing this
+                    # file, and every save rewrites label_num_dic.json.
+                    self.saveQueue.flush()
+                    self.journalSaved()
+                    job()
+                    self.journal.saved(savefilename, self.canvas.shapes)
                 self.process_image_num += 1
+                if self.manifest is not None:
+                    self.manifest.setAnnotated(self.filename, True)
             else:
                 lf.save(
                     filename,
@@ -942,6 +1017,34 @@ class MainWindow(QMainWindow, WindowMixin):
                               u'<b>%s</b>' % e)
             return False
 
+    @staticmethod
+    def writePascalVoc(savefilename, imagePath, image_size, shapes,
+                       shape_type, label_num_dic, saveDir):
+        imgFileName = os.path.basename(imagePath)
+        if shape_type == 'POLYGON':
+            with open(saveDir + 'label_num_dic.json', 'w') as label_num_file:
+                json.dump(label_num_dic, label_num_file)
+            # the mask image will be save as file_mask.jpg etc.
+            result_path = saveDir + \
+                imgFileName.replace('.', '_mask.').split('.')[0] + '.png'
+            mask_writer = label_mask_writer(
+                label_num_dic, result_path, image_size[1], image_size[0])
+            mask_writer.save_mask_image(shapes)
+        LabelFile().savePascalVocFormat(
+            savefilename, image_size, shapes, imagePath,
+            shape_type_=shape_type)
+
+    def labelsSaved(self, filename):
+        self.journalSaved()
+        self.status('Saved to  %s' % filename)
+
+    def journalSaved(self):
+        for filename in self.saveQueue.takeSaved():
+            self.journal.saved(filename)
+
+    def labelsSaveFailed(self, filename, message):
+        self.status(u'Error saving %s: %s' % (filename, message), 0)
+
     def copySelectedShape(self):
         self.addLabel(self.canvas.copySelectedShape())
         # fix copy and delete
@@ -958,6 +1061,7 @@ class MainWindow(QMainWindow, WindowMixin):
         label = unicode(item.text())
         if label != shape.label:
             shape.label = unicode(item.text())
+            self.journal.relabel(shape)
             self.setDirty()
         else:  # User probably changed item visibility
             self.canvas.setShapeVisible(shape, item.checkState() == Qt.Checked)
@@ -1055,10 +1159,11 @@ class MainWindow(QMainWindow, WindowMixin):
         if filename is None:
             filename = self.settings['filename']
         filename = unicode(filename)
-        if filename and self.fileListWidget.count() > 0:
-            index = self.mImgList.index(filename)
-            fileWidgetItem = self.fileListWidget.item(index)
-            self.fileListWidget.setItemSelected(fileWidgetItem, True)
+        if filename in self.mImgList:
+            self.currIndex = self.mImgList.index(filename)
+            if self.currIndex < self.fileListModel.rowCount():
+                self.fileListWidget.setCurrentIndex(
+                    self.fileListModel.index(self.currIndex))
         if QFile.exists(filename):
             if LabelFile.isLabelFile(filename):
                 try:
@@ -1073,54 +1178,128 @@ class MainWindow(QMainWindow, WindowMixin):
                 self.imageData = self.labelFile.imageData
                 self.lineColor = QColor(*self.labelFile.lineColor)
                 self.fillColor = QColor(*self.labelFile.fillColor)
+                image = fullSize = None
             else:
                 # Load image:
-                # read data first and store for saving into label file.
-                self.imageData = read(filename, None)
+                # take it from the decode-ahead cache if it is there,
+                # otherwise read and decode it in the background and
+                # finish loading in imageLoaded.
                 self.labelFile = None
+                cached = self.prefetcher.get(filename)
+                if cached is None:
+                    self.toggleActions(False)
+                    self.canvas.setPlaceholder(
+                        u'Loading %s ...' % os.path.basename(filename))
+                    self.imageLoader.request(filename, self.previewSize)
+                    return True
+                self.imageData, image, fullSize = cached
+            return self.finishLoadFile(filename, image, fullSize)
+        return False
+
+    def imageLoaded(self, generation, filename, data, image, fullSize):
+        # Results of requests made before the latest one are stale.
+        if not self.imageLoader.isCurrent(generation):
+            return
+        if filename == self.filename:
+            # Full resolution version of the image being shown.
+            self.upgradeImage(image)
+            return
+        self.imageData = data
+        self.finishLoadFile(filename, image, fullSize)
+
+    def finishLoadFile(self, filename, image=None, fullSize=None):
+        if image is None:
             image = QImage.fromData(self.imageData)
-            if image.isNull():
+        if image.isNull():
+            self.canvas.setPlaceholder(
+                u'Could not open %s' % os.path.basename(unicode(filename)))
+            if fullSize is not None and needsTiles(fullSize) and \
+                    not canDecodeRegions(filename):
+                self.errorMessage(
+                    u'Image too large',
+                    u"<p><i>%s</i> is %dx%d pixels, too large to be "
+                    u"decoded whole, and its format can't be decoded by "
+                    u"region.</p><p>Convert it to JPEG to open it.</p>" %
+                    (filename, fullSize.width(), fullSize.height()))
+            else:
                 self.errorMessage(
                     u'Error opening file',
                     u"<p>Make sure <i>%s</i> is a valid image file." %
                     filename)
-                self.status("Error reading %s" % filename)
-                return False
-            self.status("Loaded %s" % os.path.basename(unicode(filename)))
-            self.setWindowTitle(
-                __appname__ +
-                ' ' +
-                os.path.basename(
-                    unicode(filename)))
-            self.image = image
-            self.image_size = []  # image size should be clear
-            self.image_size.append(image.width())
-            self.image_size.append(image.height())
-            self.image_size.append(3)
-            self.filename = filename
-            self.canvas.loadPixmap(QPixmap.fromImage(image))
-            if self.labelFile:
-                self.loadLabels(self.labelFile.shapes)
-            self.setClean()
-            self.canvas.setEnabled(True)
-            self.adjustScale(initial=True)
-            self.paintCanvas()
-            self.addRecentFile(self.filename)
-            self.toggleActions(True)
-
-            # Label xml file and show bound box according to its filename
-            if self.usingPascalVocFormat is True and \
-                    self.defaultSaveDir is not None:
-                basename = os.path.basename(os.path.splitext(self.filename)[0])
-                xmlPath = os.path.join(self.defaultSaveDir, basename + '.xml')
-                self.loadPascalXMLByFilename(xmlPath)
-                if self.shape_type == 'POLYGON':
-                    self.canvas.set_shape_type(1)
-                elif self.shape_type == 'RECT':
-                    self.canvas.set_shape_type(0)
+            self.status("Error reading %s" % filename)
+            return False
+        self.status("Loaded %s" % os.path.basename(unicode(filename)))
+        self.setWindowTitle(
+            __appname__ +
+            ' ' +
+            os.path.basename(
+                unicode(filename)))
+        if fullSize is None:
+            fullSize = image.size()
+        self.image = image
+        self.image_size = []  # image size should be clear
+        self.image_size.append(fullSize.width())
+        self.image_size.append(fullSize.height())
+        self.image_size.append(3)
+        self.filename = filename
+        if self.manifest is not None:
+            self.manifest.setImageSize(
+                filename, fullSize.width(), fullSize.height())
+        self.canvas.loadPixmap(QPixmap.fromImage(image), fullSize)
+        if self.labelFile is None and needsTiles(fullSize):
+            # Too large to decode whole; zoom in through tiles instead.
+            self.canvas.setTiles(TilePyramid(filename, fullSize))
+        if self.labelFile:
+            self.loadLabels(self.labelFile.shapes)
+        self.setClean()
+        self.canvas.setEnabled(True)
+        self.adjustScale(initial=True)
+        self.paintCanvas()
+        self.addRecentFile(self.filename)
+        self.toggleActions(True)
+        if self.labelFile is None and self.imageData is not None:
+            self.prefetcher.put(self.filename, self.imageData, image, fullSize)
+        self.prefetchNeighbours()
+
+        # Label xml file and show bound box according to its filename,
+        # unless recovered edits were made against another one.
+        xmlPath = self.journal.recoveredXml(self.filename)
+        if xmlPath is None and self.usingPascalVocFormat is True and \
+                self.defaultSaveDir is not None:
+            basename = os.path.basename(os.path.splitext(self.filename)[0])
+            xmlPath = os.path.join(self.defaultSaveDir, basename + '.xml')
+        if xmlPath is not None:
+            self.loadPascalXMLByFilename(xmlPath, journal=True)
+            if self.shape_type == 'POLYGON':
+                self.canvas.set_shape_type(1)
+            elif self.shape_type == 'RECT':
+                self.canvas.set_shape_type(0)
 
-            return True
-        return False
+        return True
+
+    def upgradeResolution(self):
+        """Decode the full resolution image once zoomed in past the
+        resolution of the preview being shown."""
+        if self.filename is None or self.upgradePending == self.filename or \
+                self.canvas.tiles is not None:
+            return
+        pixmapScale = self.canvas.pixmapScale()
+        if pixmapScale >= 1.0 or self.canvas.scale <= pixmapScale:
+            return
+        self.upgradePending = self.filename
+        self.imageLoader.request(self.filename, data=self.imageData)
+
+    def upgradeImage(self, image):
+        self.upgradePending = None
+        if image.isNull():
+            return
+        self.image = image
+        self.canvas.upgradePixmap(QPixmap.fromImage(image))
+        self.prefetcher.put(self.filename, self.imageData, image)
+
+    def prefetchNeighbours(self):
+        if self.currIndex is not None:
+            self.prefetcher.prefetch(self.mImgList, self.currIndex)
 
     def resizeEvent(self, event):
         if self.canvas and not self.image.isNull() \
@@ -1133,6 +1312,7 @@ class MainWindow(QMainWindow, WindowMixin):
         self.canvas.scale = 0.01 * self.zoomWidget.value()
         self.canvas.adjustSize()
         self.canvas.update()
+        self.upgradeResolution()
 
     def adjustScale(self, initial=False):
         value = self.scalers[self.FIT_WINDOW if initial else self.zoomMode]()
@@ -1145,19 +1325,27 @@ class MainWindow(QMainWindow, WindowMixin):
         h1 = self.centralWidget().height() - e
         a1 = w1 / h1
         # Calculate a new scale value based on the pixmap's aspect ratio.
-        w2 = self.canvas.pixmap.width() - 0.0
-        h2 = self.canvas.pixmap.height() - 0.0
+        w2 = self.canvas.imageSize.width() - 0.0
+        h2 = self.canvas.imageSize.height() - 0.0
         a2 = w2 / h2
         return w1 / w2 if a2 >= a1 else h1 / h2
 
     def scaleFitWidth(self):
         # The epsilon does not seem to work too well here.
         w = self.centralWidget().width() - 2.0
-        return w / self.canvas.pixmap.width()
+        return w / self.canvas.imageSize.width()
 
     def closeEvent(self, event):
         if not self.mayContinue():
             event.ignore()
+        else:
+            self.stopImageScanner()
+            self.saveQueue.stop()
+            # The saved signals of the last saves won't be delivered.
+            self.journalSaved()
+            self.journal.close()
+            if self.manifest is not None:
+                self.manifest.saveInBackground()
         s = self.settings
         # If it loads images from dir, don't load it at the begining
         if self.dirname is None:
@@ -1191,18 +1379,40 @@ class MainWindow(QMainWindow, WindowMixin):
         if self.mayContinue():
             self.loadFile(filename)
 
-    def scanAllImages(self, folderPath):
-        extensions = ['.jpeg', '.jpg', '.png', '.bmp']
-        images = []
-
-        for root, dirs, files in os.walk(folderPath):
-            for file in files:
-                if file.lower().endswith(tuple(extensions)):
-                    relatviePath = os.path.join(root, file)
-                    images.append(os.path.abspath(relatviePath))
-        images.sort(key=lambda x: x.lower())
-        print images
-        return images
+    def startImageScanner(self, folderPath):
+        """Fill mImgList from a background scan of folderPath."""
+        self.stopImageScanner()
+        if self.manifest is not None:
+            self.manifest.saveInBackground()
+        self.manifest = None
+        if self.defaultSaveDir is not None:
+            self.manifest = ImageManifest(
+                manifestPath(self.defaultSaveDir), self.defaultSaveDir)
+        scanner = ImageScanner(folderPath, self.manifest)
+        scanner.imagesFound.connect(partial(self.addScannedImages, scanner))
+        scanner.scanFinished.connect(partial(self.scanFinished, scanner))
+        self.imageScanner = scanner
+        scanner.start()
+
+    def stopImageScanner(self):
+        if self.imageScanner is not None:
+            self.imageScanner.stop()
+            self.imageScanner.wait()
+            self.imageScanner = None
+
+    def addScannedImages(self, scanner, images):
+        if scanner is not self.imageScanner:
+            return
+        self.mImgList.extend(images)
+        self.fileListModel.sync()
+        # Show the first image as soon as it has been found.
+        if self.currIndex is None and self.filename is None:
+            self.openNextImg()
+
+    def scanFinished(self, scanner, count):
+        if scanner is not self.imageScanner:
+            return
+        self.status('Found %d images in %s' % (count, self.dirname))
 
     def changeSavedir(self, _value=False):
         if self.defaultSaveDir is not None:
@@ -1299,29 +1509,27 @@ class MainWindow(QMainWindow, WindowMixin):
             '%s . Annotation will be saved to %s' %
             ('Change saved folder', self.defaultSaveDir))
         self.statusBar().show()
-        self.mImgList = self.scanAllImages(dirpath)
+        self.mImgList = ImageList()
+        self.fileListModel.setPaths(self.mImgList)
         self.filename = None
-        self.openNextImg()
-        for imgPath in self.mImgList:
-            item = QListWidgetItem(imgPath)
-            self.fileListWidget.addItem(item)
+        self.currIndex = None
+        self.startImageScanner(dirpath)
 
     def openPrevImg(self, _value=False):
         if self.autoSaving is True and self.defaultSaveDir is not None:
             if self.dirty is True and self.hasLabels():
-                self.saveFile()
+                self.saveFile(background=True)
         if not self.mayContinue():
             return
 
         if len(self.mImgList) <= 0:
             return
 
-        if self.filename is None:
+        if self.currIndex is None:
             return
 
-        currIndex = self.mImgList.index(self.filename)
-        if currIndex - 1 >= 0:
-            filename = self.mImgList[currIndex - 1]
+        if self.currIndex - 1 >= 0:
+            filename = self.mImgList[self.currIndex - 1]
             if filename:
                 self.loadFile(filename)
 
@@ -1329,7 +1537,7 @@ class MainWindow(QMainWindow, WindowMixin):
         # Proceding next image without dialog if having any label
         if self.autoSaving is True and self.defaultSaveDir is not None:
             if self.dirty is True:
-                self.saveFile()
+                self.saveFile(background=True)
 
        # if not self.mayContinue():
         #    return
@@ -1337,12 +1545,11 @@ class MainWindow(QMainWindow, WindowMixin):
         if len(self.mImgList) <= 0:
             return
 
-        if self.filename is None:
+        if self.currIndex is None:
             filename = self.mImgList[0]
         else:
-            currIndex = self.mImgList.index(self.filename)
-            if currIndex + 1 < len(self.mImgList):
-                filename = self.mImgList[currIndex + 1]
+            if self.currIndex + 1 < len(self.mImgList):
+                filename = self.mImgList[self.currIndex + 1]
             else:
                 QMessageBox.about(self, "no more images !",
                                   "this is the last image")
@@ -1371,7 +1578,7 @@ class MainWindow(QMainWindow, WindowMixin):
         if filename:
             self.loadFile(filename)
 
-    def saveFile(self, _value=False):
+    def saveFile(self, _value=False, background=False):
         assert not self.image.isNull(), "cannot save empty image"
         if self.hasLabels():
             if self.defaultSaveDir is not None and len(
@@ -1382,7 +1589,7 @@ class MainWindow(QMainWindow, WindowMixin):
                     imgFileName)[0] + LabelFile.suffix
                 savedPath = os.path.join(
                     str(self.defaultSaveDir), savedFileName)
-                self._saveFile(savedPath)
+                self._saveFile(savedPath, background)
             else:
                 self._saveFile(self.filename if self.labelFile
                                else self.saveFileDialog())
@@ -1390,8 +1597,12 @@ class MainWindow(QMainWindow, WindowMixin):
             imgFileName = os.path.basename(self.filename)
             savedFileName = os.path.splitext(imgFileName)[0] + LabelFile.suffix
             savedPath = os.path.join(str(self.defaultSaveDir), savedFileName)
+            # Don't let a queued save bring the file back.
+            self.saveQueue.flush(savedPath)
             if os.path.isfile(savedPath):
                 os.remove(savedPath)
+                if self.manifest is not None:
+                    self.manifest.setAnnotated(self.filename, False)
 
     def saveFileAs(self, _value=False):
         assert not self.image.isNull(), "cannot save empty image"
@@ -1413,11 +1624,12 @@ class MainWindow(QMainWindow, WindowMixin):
             return dlg.selectedFiles()[0]
         return ''
 
-    def _saveFile(self, filename):
-        if filename and self.saveLabels(filename):
+    def _saveFile(self, filename, background=False):
+        if filename and self.saveLabels(filename, background):
             self.addRecentFile(filename)
             self.setClean()
-            self.statusBar().showMessage('Saved to  %s' % filename)
+            if not background:
+                self.statusBar().showMessage('Saved to  %s' % filename)
             self.statusBar().show()
 
     def closeFile(self, _value=False):
@@ -1504,7 +1716,10 @@ class MainWindow(QMainWindow, WindowMixin):
         self.setDirty()
 
     def moveShape(self):
+        shape = self.canvas.selectedShape
         self.canvas.endMove(copy=False)
+        self.journal.replace(shape, self.canvas.shapes[-1])
+        self.journal.move(self.canvas.shapes[-1])
         self.setDirty()
 
     def labelColorDoubleClicked(self):
@@ -1575,16 +1790,38 @@ class MainWindow(QMainWindow, WindowMixin):
                 self.label_num_dic[label] = num
                 num += 1
 
-    def loadPascalXMLByFilename(self, filename):
+    def loadPascalXMLByFilename(self, filename, journal=False):
+        """Add the shapes of an annotation file to the canvas. With journal,
+        they are the image's own, which unsaved edits of a crashed session
+        are replayed onto and new edits are journaled against."""
         if self.filename is None:
             return
-        if os.path.exists(filename) is False:
+        # It may still be on its way to the disk.
+        self.saveQueue.flush(filename)
+        shapes = []
+        if os.path.exists(filename):
+            tVocParseReader = PascalVocReader(filename)
+            shapes = tVocParseReader.getShapes()
+            self.shape_type = tVocParseReader.getShapeType()
+        if journal:
+            recovering = self.journal.recoveredXml(self.filename) is not None
+            ids, shapes = self.journal.replay(self.filename, shapes)
+            if recovering and self.journal.isDropped(self.filename):
+                self.errorMessage(
+                    u'Could not recover changes',
+                    u'<p>%s changed since the unsaved changes to %s were '
+                    u'made, so they were not applied.</p><p>They are kept '
+                    u'in %s.</p>' % (filename, os.path.basename(
+                        self.filename), self.journal.path))
+        if shapes:
+            self.loadLabels(shapes)
+        if not journal:
             return
-
-        tVocParseReader = PascalVocReader(filename)
-        shapes = tVocParseReader.getShapes()
-        self.loadLabels(shapes)
-        self.shape_type = tVocParseReader.getShapeType()
+        if self.journal.open(self.filename, filename, ids,
+                             self.canvas.shapes if shapes else []):
+            self.setDirty()
+            self.status('Recovered unsaved changes to %s' %
+                        os.path.basename(self.filename))
 
 
 class Settings(object):
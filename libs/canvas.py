@@ -4,6 +4,10 @@ from PyQt4.QtCore import *
 
 from shape import Shape
 from lib import distance
+from spatialIndex import GridIndex
+from vertexIndex import VertexIndex
+from shapeRenderer import paintShapes
+from labelCache import labelCache
 
 CURSOR_DEFAULT = Qt.ArrowCursor
 CURSOR_POINT = Qt.PointingHandCursor
@@ -26,6 +30,18 @@ class Canvas(QWidget):
     RECT_SHAPE, POLYGON_SHAPE = range(2)
 
     epsilon = 11.0
+    # Mouse moves are handled at most once per this many milliseconds
+    # (a display frame), the latest position winning.
+    move_interval = 16
+    # Level of detail, in screen pixels: shapes smaller than lod_point_size
+    # are drawn as a dot, smaller than lod_vertex_size (or dense, see
+    # Shape.isDense) with a simplified outline and no vertex markers, and
+    # labels smaller than lod_label_size are not drawn.
+    lod_point_size = 4
+    lod_vertex_size = 24
+    lod_label_size = 6
+    # Largest background (in pixels) kept pre-scaled between repaints.
+    max_scaled_pixels = 4096 * 4096
 
     def __init__(self, *args, **kwargs):
         super(Canvas, self).__init__(*args, **kwargs)
@@ -33,6 +49,10 @@ class Canvas(QWidget):
         self.shape_type = self.POLYGON_SHAPE
         self.mode = self.EDIT
         self.shapes = []
+        # Grid over the shapes' bounding boxes for hit-testing.
+        self.shapeIndex = GridIndex()
+        # All the shapes' vertices, for finding the hovered one.
+        self.vertexIndex = VertexIndex()
         self.current = None
         self.selectedShape = None  # save the selected shape here
         self.selectedShapeCopy = None
@@ -42,6 +62,14 @@ class Canvas(QWidget):
         self.offsets = QPointF(), QPointF()
         self.scale = 1.0
         self.pixmap = QPixmap()
+        # Size of the image in image coordinates, which the pixmap may
+        # only be a reduced resolution version of.
+        self.imageSize = QSize()
+        # Tile pyramid drawn over the pixmap when zoomed in on huge images.
+        self.tiles = None
+        # The pixmap resampled to the current zoom level, and its key.
+        self._scaledPixmap = None
+        self._scaledKey = None
         self.visible = {}
         self._hideBackround = False
         self.hideBackround = False
@@ -49,7 +77,16 @@ class Canvas(QWidget):
         self.hVertex = None
         self._painter = QPainter()
         self.font_size = 50
+        self._labelFont = None
+        # Text shown instead of the image while it is loading.
+        self.placeholder = None
         self._cursor = CURSOR_DEFAULT
+        # Position and buttons of the last mouse move not handled yet.
+        self._pendingMove = None
+        self._moveTimer = QTimer(self)
+        self._moveTimer.setSingleShot(True)
+        self._moveTimer.setInterval(self.move_interval)
+        self._moveTimer.timeout.connect(self.flushMouseMove)
         # Menus:
         self.menus = (QMenu(), QMenu())
         # Set widget options.
@@ -90,6 +127,7 @@ class Canvas(QWidget):
     def setEditing(self, value=True):
         self.mode = self.EDIT if value else self.CREATE
         if not value:  # Create
+            self.updateArea(self.shapeArea(self.hShape))
             self.unHighlight()
             self.deSelectShape()
 
@@ -102,15 +140,32 @@ class Canvas(QWidget):
         return self.hVertex is not None
 
     def mouseMoveEvent(self, ev):
-        """Update line with last point and current coordinates."""
-        pos = self.transformPos(ev.posF())
+        """Handle the move right away if none was handled during the last
+        frame, otherwise keep it for the end of the frame. Moves arriving
+        in between replace each other."""
+        self._pendingMove = QPointF(ev.posF()), ev.buttons()
+        if not self._moveTimer.isActive():
+            self.flushMouseMove()
+
+    def flushMouseMove(self):
+        """Handle the pending mouse move, if any."""
+        if self._pendingMove is None:
+            return
+        pos, buttons = self._pendingMove
+        self._pendingMove = None
+        self._moveTimer.start()
+        self.handleMouseMove(self.transformPos(pos), buttons)
 
+    def handleMouseMove(self, pos, buttons):
+        """Update line with last point and current coordinates."""
         self.restoreCursor()
 
         # Polygon drawing.
         if self.drawing():
             self.overrideCursor(CURSOR_DRAW)
             if self.current:
+                before = self.shapeArea(self.current, self.line)
+                self.current.highlightClear()
                 color = self.lineColor
                 if self.outOfPixmap(pos):
                     # Don't allow the user to draw outside the pixmap.
@@ -125,44 +180,52 @@ class Canvas(QWidget):
                     self.current.highlightVertex(0, Shape.NEAR_VERTEX)
                 self.line[1] = pos
                 self.line.line_color = color
-                self.repaint()
-                self.current.highlightClear()
+                self.updateArea(before, self.shapeArea(self.current, self.line))
             return
 
         # Polygon copy moving.
-        if Qt.RightButton & ev.buttons():
+        if Qt.RightButton & buttons:
             if self.selectedShapeCopy and self.prevPoint:
                 self.overrideCursor(CURSOR_MOVE)
+                before = self.shapeArea(self.selectedShapeCopy)
                 self.boundedMoveShape(self.selectedShapeCopy, pos)
-                self.repaint()
+                self.updateArea(before, self.shapeArea(self.selectedShapeCopy))
             elif self.selectedShape:
                 self.selectedShapeCopy = self.selectedShape.copy()
-                self.repaint()
+                self.updateArea(self.shapeArea(self.selectedShapeCopy))
             return
 
         # Polygon/Vertex moving.
-        if Qt.LeftButton & ev.buttons():
+        if Qt.LeftButton & buttons:
             if self.selectedVertex():
+                before = self.shapeArea(self.hShape)
                 self.boundedMoveVertex(pos)
                 self.shapeMoved.emit()
-                self.repaint()
+                self.updateArea(before, self.shapeArea(self.hShape))
             elif self.selectedShape and self.prevPoint:
                 self.overrideCursor(CURSOR_MOVE)
+                before = self.shapeArea(self.selectedShape)
                 self.boundedMoveShape(self.selectedShape, pos)
                 self.shapeMoved.emit()
-                self.repaint()
+                self.updateArea(before, self.shapeArea(self.selectedShape))
             return
 
         # Just hovering over the canvas, 2 posibilities:
         # - Highlight shapes
         # - Highlight vertex
         # Update shape/vertex fill and tooltip value accordingly.
+        previous = self.hShape, self.hVertex
         self.setToolTip("Image")
-        for shape in reversed([s for s in self.shapes if self.isVisible(s)]):
-            # Look for a nearby vertex to highlight. If that fails,
-            # check if we happen to be inside a shape.
-            index = shape.nearestVertex(pos, self.epsilon)
-            if index is not None:
+        # The topmost visible shape with a vertex nearby.
+        vertexShape, index = next(
+            ((shape, i) for shape, i in self.vertexIndex.query(pos, self.epsilon)
+             if self.isVisible(shape)), (None, None))
+        for shape in self.shapeIndex.query(pos, self.epsilon):
+            if not self.isVisible(shape):
+                continue
+            # Highlight the nearby vertex, unless a shape above it
+            # contains the point.
+            if shape is vertexShape:
                 if self.selectedVertex():
                     self.hShape.highlightClear()
                 self.hVertex, self.hShape = index, shape
@@ -170,7 +233,6 @@ class Canvas(QWidget):
                 self.overrideCursor(CURSOR_POINT)
                 self.setToolTip("Click & drag to move point")
                 self.setStatusTip(self.toolTip())
-                self.update()
                 break
             elif shape.containsPoint(pos):
                 if self.selectedVertex():
@@ -181,15 +243,17 @@ class Canvas(QWidget):
                     shape.label)
                 self.setStatusTip(self.toolTip())
                 self.overrideCursor(CURSOR_GRAB)
-                self.update()
                 break
         else:  # Nothing found, clear highlights, reset state.
             if self.hShape:
                 self.hShape.highlightClear()
-                self.update()
             self.hVertex, self.hShape = None, None
+        if (self.hShape, self.hVertex) != previous:
+            self.updateArea(self.shapeArea(previous[0], self.hShape))
 
     def mousePressEvent(self, ev):
+        # Catch up with the pointer before acting on where it is.
+        self.flushMouseMove()
         pos = self.transformPos(ev.posF())
         if ev.button() == Qt.LeftButton:
             if self.drawing():
@@ -218,25 +282,29 @@ class Canvas(QWidget):
                     self.line.points = [pos, pos]
                     self.setHiding()
                     self.drawingPolygon.emit(True)
-                    self.update()
+                    self.updateArea(self.shapeArea(self.current, self.line))
             else:
-                self.selectShapePoint(pos)
-                self.prevPoint = pos
-                self.repaint()
+                self.pressShapePoint(pos)
         elif ev.button() == Qt.RightButton and self.editing():
-            self.selectShapePoint(pos)
-            self.prevPoint = pos
-            self.repaint()
+            self.pressShapePoint(pos)
+
+    def pressShapePoint(self, pos):
+        before = self.shapeArea(self.selectedShape, self.hShape)
+        self.selectShapePoint(pos)
+        self.prevPoint = pos
+        self.updateArea(before, self.shapeArea(self.selectedShape))
 
     def mouseReleaseEvent(self, ev):
+        self.flushMouseMove()
         if ev.button() == Qt.RightButton:
             menu = self.menus[bool(self.selectedShapeCopy)]
             self.restoreCursor()
             if not menu.exec_(self.mapToGlobal(ev.pos()))\
                and self.selectedShapeCopy:
                 # Cancel the move by deleting the shadow copy.
+                area = self.shapeArea(self.selectedShapeCopy)
                 self.selectedShapeCopy = None
-                self.repaint()
+                self.updateArea(area)
         elif ev.button() == Qt.LeftButton and self.selectedShape:
             self.overrideCursor(CURSOR_GRAB)
 
@@ -247,13 +315,16 @@ class Canvas(QWidget):
         #del shape.line_color
         if copy:
             self.shapes.append(shape)
+            self.indexShape(shape)
             self.selectedShape.selected = False
+            self.updateArea(self.shapeArea(self.selectedShape, shape))
             self.selectedShape = shape
-            self.repaint()
         else:
             shape.label = self.selectedShape.label
             self.deleteSelected()
             self.shapes.append(shape)
+            self.indexShape(shape)
+            self.updateArea(self.shapeArea(shape))
         self.selectedShapeCopy = None
 
     def hideBackroundShapes(self, value):
@@ -262,10 +333,14 @@ class Canvas(QWidget):
             # Only hide other shapes if there is a current selection.
             # Otherwise the user will not be able to select a shape.
             self.setHiding(True)
-            self.repaint()
+            self.update()
 
     def setHiding(self, enable=True):
-        self._hideBackround = self.hideBackround if enable else False
+        hiding = self.hideBackround if enable else False
+        if hiding != self._hideBackround:
+            # Every other shape appears or disappears.
+            self.update()
+        self._hideBackround = hiding
 
     def canCloseShape(self):
         return self.drawing() and self.current and len(self.current) > 2
@@ -283,7 +358,7 @@ class Canvas(QWidget):
         self.selectedShape = shape
         self.setHiding()
         self.selectionChanged.emit(True)
-        self.update()
+        self.updateArea(self.shapeArea(shape))
 
     def selectShapePoint(self, point):
         """Select the first shape created which contains this point."""
@@ -292,7 +367,7 @@ class Canvas(QWidget):
             index, shape = self.hVertex, self.hShape
             shape.highlightVertex(index, shape.MOVE_VERTEX)
             return
-        for shape in reversed(self.shapes):
+        for shape in self.shapeIndex.query(point):
             if self.isVisible(shape) and shape.containsPoint(point):
                 shape.selected = True
                 self.selectedShape = shape
@@ -331,6 +406,7 @@ class Canvas(QWidget):
                 lshift = QPointF(0, shiftPos.y())
             shape.moveVertexBy(rindex, rshift)
             shape.moveVertexBy(lindex, lshift)
+        self.reindexShape(shape)
 
     def boundedMoveShape(self, shape, pos):
         if self.outOfPixmap(pos):
@@ -340,8 +416,8 @@ class Canvas(QWidget):
             pos -= QPointF(min(0, o1.x()), min(0, o1.y()))
         o2 = pos + self.offsets[1]
         if self.outOfPixmap(o2):
-            pos += QPointF(min(0, self.pixmap.width() - o2.x()),
-                           min(0, self.pixmap.height() - o2.y()))
+            pos += QPointF(min(0, self.imageSize.width() - o2.x()),
+                           min(0, self.imageSize.height() - o2.y()))
         # The next line tracks the new position of the cursor
         # relative to the shape, but also results in making it
         # a bit "shaky" when nearing the border and allows it to
@@ -350,6 +426,7 @@ class Canvas(QWidget):
         dp = pos - self.prevPoint
         if dp:
             shape.moveBy(dp)
+            self.reindexShape(shape)
             self.prevPoint = pos
             return True
         return False
@@ -357,17 +434,18 @@ class Canvas(QWidget):
     def deSelectShape(self):
         if self.selectedShape:
             self.selectedShape.selected = False
+            self.updateArea(self.shapeArea(self.selectedShape))
             self.selectedShape = None
             self.setHiding(False)
             self.selectionChanged.emit(False)
-            self.update()
 
     def deleteSelected(self):
         if self.selectedShape:
             shape = self.selectedShape
             self.shapes.remove(self.selectedShape)
+            self.unindexShape(shape)
             self.selectedShape = None
-            self.update()
+            self.updateArea(self.shapeArea(shape))
             return shape
 
     def copySelectedShape(self):
@@ -378,6 +456,8 @@ class Canvas(QWidget):
             shape.selected = True
             self.selectedShape = shape
             self.boundedShiftShape(shape)
+            self.indexShape(shape)
+            self.updateArea(self.shapeArea(shape))
             return shape
 
     def boundedShiftShape(self, shape):
@@ -390,29 +470,65 @@ class Canvas(QWidget):
         if not self.boundedMoveShape(shape, point - offset):
             self.boundedMoveShape(shape, point + offset)
 
+    def setPlaceholder(self, text):
+        self.placeholder = text
+        self.update()
+
     def paintEvent(self, event):
         if not self.pixmap:
+            if self.placeholder:
+                p = self._painter
+                p.begin(self)
+                p.drawText(self.rect(), Qt.AlignCenter, self.placeholder)
+                p.end()
+                return
             return super(Canvas, self).paintEvent(event)
 
         p = self._painter
         p.begin(self)
-        p.setFont(QFont('Times', self.font_size, QFont.Bold))
+        p.setFont(self.labelFont())
         p.setRenderHint(QPainter.Antialiasing)
         p.setRenderHint(QPainter.HighQualityAntialiasing)
         p.setRenderHint(QPainter.SmoothPixmapTransform)
 
+        scaled = self.scaledPixmap()
+        if scaled is not None:
+            # Blit the cached background instead of resampling the image.
+            p.drawPixmap((self.offsetToCenter() * self.scale).toPoint(), scaled)
+
         p.scale(self.scale, self.scale)
         p.translate(self.offsetToCenter())
 
-        p.drawPixmap(0, 0, self.pixmap)
+        if scaled is None:
+            # Stretch the pixmap (which may be a reduced resolution
+            # preview) over the whole image.
+            p.drawPixmap(QRectF(QPointF(0, 0), QSizeF(self.imageSize)),
+                         self.pixmap, QRectF(self.pixmap.rect()))
+        if self.tiles is not None and self.scale > self.pixmapScale():
+            self.tiles.paint(p, self.visibleImageRect(), self.scale)
         Shape.scale = self.scale
+        # Only the shapes reaching into the region being repainted.
+        exposed = QRectF(event.rect())
+        exposed = QRectF(self.transformPos(exposed.topLeft()),
+                         self.transformPos(exposed.bottomRight()))
+        batched, single = [], []
         for shape in self.shapes:
+            if not self.paintRect(shape).intersects(exposed):
+                continue
             if shape.fill_color:
                 shape.fill = True
-                shape.paint(p)
             elif (shape.selected or not self._hideBackround) and self.isVisible(shape):
                 shape.fill = shape.selected or shape == self.hShape
-                shape.paint(p)
+            else:
+                continue
+            # The shapes the user is working on are drawn on top.
+            if shape.selected or shape is self.hShape or shape.isHighlighted():
+                single.append(shape)
+            else:
+                batched.append((shape, self.detailFor(shape)))
+        paintShapes(p, batched)
+        for shape in single:
+            shape.paint(p, self.detailFor(shape))
         if self.current:
             self.current.paint(p)
             self.line.paint(p)
@@ -433,6 +549,86 @@ class Canvas(QWidget):
 
         p.end()
 
+    def detailFor(self, shape):
+        """How much of a shape is worth drawing at the current zoom. The
+        selected and hovered shapes are always drawn in full."""
+        if shape.selected or shape is self.hShape:
+            return Shape.FULL_DETAIL
+        rect = shape.boundingRect()
+        size = max(rect.width(), rect.height()) * self.scale
+        if size < self.lod_point_size:
+            return Shape.POINT_DETAIL
+        if size < self.lod_vertex_size or shape.isDense():
+            return Shape.OUTLINE_DETAIL
+        if self.font_size * self.scale < self.lod_label_size:
+            return Shape.VERTEX_DETAIL
+        return Shape.FULL_DETAIL
+
+    def labelFont(self):
+        if self._labelFont is None or \
+                self._labelFont.pointSize() != self.font_size:
+            self._labelFont = QFont('Times', self.font_size, QFont.Bold)
+        return self._labelFont
+
+    def paintRect(self, shape):
+        """The area painted for a shape, in image coordinates: its outline
+        grown by the largest vertex marker and pen, plus its label."""
+        if not len(shape):
+            return QRectF()
+        s = self.scale
+        margin = (Shape.point_size * 2 + max(1, round(2.0 / s)) + 1) / s
+        rect = shape.boundingRect().adjusted(-margin, -margin, margin, margin)
+        if shape.label is not None and shape.shape_type == Shape.RECT_SHAPE:
+            rect = rect.united(labelCache.boundingRect(
+                shape.label, self.labelFont()).translated(shape[0]))
+        return rect
+
+    def shapeArea(self, *shapes):
+        """The united paintRect of the given shapes, None ones skipped."""
+        rect = QRectF()
+        for shape in shapes:
+            if shape is not None:
+                rect = rect.united(self.paintRect(shape))
+        return rect
+
+    def updateArea(self, *rects):
+        """Schedule a repaint of the widget area covering the given
+        rects, in image coordinates."""
+        rect = QRectF()
+        for r in rects:
+            rect = rect.united(r)
+        if rect.isEmpty():
+            return
+        offset = self.offsetToCenter()
+        area = QRectF((rect.topLeft() + offset) * self.scale,
+                      (rect.bottomRight() + offset) * self.scale)
+        self.update(area.toAlignedRect().adjusted(-1, -1, 1, 1))
+
+    def scaledPixmap(self):
+        """Return the pixmap resampled to the current zoom level, cached
+        until the zoom level or the pixmap change. Return None if it would
+        be too large to keep around."""
+        size = QSize(int(round(self.imageSize.width() * self.scale)),
+                     int(round(self.imageSize.height() * self.scale)))
+        if size == self.pixmap.size():
+            return self.pixmap
+        if size.width() * size.height() > self.max_scaled_pixels or \
+                size.isEmpty():
+            self._scaledPixmap = self._scaledKey = None
+            return None
+        key = (self.pixmap.cacheKey(), size.width(), size.height())
+        if key != self._scaledKey:
+            self._scaledPixmap = self.pixmap.scaled(
+                size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            self._scaledKey = key
+        return self._scaledPixmap
+
+    def visibleImageRect(self):
+        """The part of the image visible in the viewport."""
+        rect = QRectF(self.visibleRegion().boundingRect())
+        return QRectF(self.transformPos(rect.topLeft()),
+                      self.transformPos(rect.bottomRight()))
+
     def transformPos(self, point):
         """Convert from widget-logical coordinates to painter-logical coordinates."""
         return point / self.scale - self.offsetToCenter()
@@ -440,20 +636,22 @@ class Canvas(QWidget):
     def offsetToCenter(self):
         s = self.scale
         area = super(Canvas, self).size()
-        w, h = self.pixmap.width() * s, self.pixmap.height() * s
+        w, h = self.imageSize.width() * s, self.imageSize.height() * s
         aw, ah = area.width(), area.height()
         x = (aw - w) / (2 * s) if aw > w else 0
         y = (ah - h) / (2 * s) if ah > h else 0
         return QPointF(x, y)
 
     def outOfPixmap(self, p):
-        w, h = self.pixmap.width(), self.pixmap.height()
+        w, h = self.imageSize.width(), self.imageSize.height()
         return not (0 <= p.x() <= w and 0 <= p.y() <= h)
 
     def finalise(self):
         assert self.current
+        self.current.highlightClear()
         self.current.close()
         self.shapes.append(self.current)
+        self.indexShape(self.current)
         self.current = None
         self.setHiding(False)
         self.newShape.emit()
@@ -469,7 +667,7 @@ class Canvas(QWidget):
         # Cycle through each image edge in clockwise fashion,
         # and find the one intersecting the current line segment.
         # http://paulbourke.net/geometry/lineline2d/
-        size = self.pixmap.size()
+        size = self.imageSize
         points = [(0, 0),
                   (size.width(), 0),
                   (size.width(), size.height()),
@@ -520,7 +718,7 @@ class Canvas(QWidget):
 
     def minimumSizeHint(self):
         if self.pixmap:
-            return self.scale * self.pixmap.size()
+            return self.scale * self.imageSize
         return super(Canvas, self).minimumSizeHint()
 
     def wheelEvent(self, ev):
@@ -554,6 +752,7 @@ class Canvas(QWidget):
     def undoLastLine(self):
         assert self.shapes
         self.current = self.shapes.pop()
+        self.unindexShape(self.current)
         self.current.setOpen()
         self.line.points = [self.current[-1], self.current[0]]
         self.drawingPolygon.emit(True)
@@ -561,6 +760,7 @@ class Canvas(QWidget):
     def resetAllLines(self):
         assert self.shapes
         self.current = self.shapes.pop()
+        self.unindexShape(self.current)
         self.current.setOpen()
         self.line.points = [self.current[-1], self.current[0]]
         self.drawingPolygon.emit(True)
@@ -568,21 +768,70 @@ class Canvas(QWidget):
         self.drawingPolygon.emit(False)
         self.update()
 
-    def loadPixmap(self, pixmap):
+    def loadPixmap(self, pixmap, imageSize=None):
         self.pixmap = pixmap
+        self.imageSize = QSize(imageSize) if imageSize is not None \
+            else pixmap.size()
+        self.setTiles(None)
+        self._scaledPixmap = self._scaledKey = None
+        self.placeholder = None
         self.shapes = []
-        self.repaint()
+        self.rebuildIndex()
+        self.update()
+
+    def upgradePixmap(self, pixmap):
+        """Replace the pixmap by a higher resolution one of the same image."""
+        self.pixmap = pixmap
+        self._scaledPixmap = self._scaledKey = None
+        self.update()
+
+    def indexShape(self, shape):
+        self.shapeIndex.insert(shape)
+        self.vertexIndex.insert(shape)
+
+    def reindexShape(self, shape):
+        self.shapeIndex.update(shape)
+        self.vertexIndex.update(shape)
+
+    def unindexShape(self, shape):
+        self.shapeIndex.remove(shape)
+        self.vertexIndex.remove(shape)
+
+    def rebuildIndex(self):
+        self.shapeIndex.rebuild(self.shapes, self.indexCellSize())
+        self.vertexIndex.rebuild(self.shapes)
+
+    def indexCellSize(self):
+        # About 64 cells across the image, so that large shapes do not
+        # span too many cells.
+        return max(32.0, max(self.imageSize.width(),
+                             self.imageSize.height()) / 64.0)
+
+    def setTiles(self, tiles):
+        if self.tiles is not None:
+            self.tiles.cancel()
+        self.tiles = tiles
+        if tiles is not None:
+            tiles.tileLoaded.connect(self.update)
+        self.update()
+
+    def pixmapScale(self):
+        """Resolution of the pixmap relative to the image."""
+        if not self.pixmap or not self.imageSize.width():
+            return 1.0
+        return float(self.pixmap.width()) / self.imageSize.width()
 
     def loadShapes(self, shapes):
         self.shapes = list(shapes)
+        self.rebuildIndex()
         self.shape_type = shapes[0].get_shape_type()
         print self.shape_type
         self.current = None
-        self.repaint()
+        self.update()
 
     def setShapeVisible(self, shape, value):
         self.visible[shape] = value
-        self.repaint()
+        self.updateArea(self.shapeArea(shape))
 
     def overrideCursor(self, cursor):
         self.restoreCursor()
@@ -595,4 +844,8 @@ class Canvas(QWidget):
     def resetState(self):
         self.restoreCursor()
         self.pixmap = None
+        self.setTiles(None)
+        self._scaledPixmap = self._scaledKey = None
+        self.placeholder = None
+        self._pendingMove = None
         self.update()
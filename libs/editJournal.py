@@ -0,0 +1,263 @@
+import json
+import os
+from collections import OrderedDict
+
+
+class EditJournal(object):
+    """Append-only log of the shape edits not saved yet, from which they
+    are replayed onto the annotation file after a crash.
+
+    The journal is a file of JSON lines. An "open" record starts a
+    session for an image: the n shapes read from its annotation file get
+    the ids 0 to n - 1, added shapes the following ones. The edit records
+    ("add", "move", "label", "delete") belong to the last session opened.
+    A session ends with "close" when its edits were dropped (or never
+    made) and with "saved" once its annotation file has been written.
+
+    Records are buffered and written by flush(), with consecutive moves
+    of a shape coalesced. The file is truncated whenever a session opens
+    with nothing left to recover; recovered edits which could not be
+    replayed are kept in it until the user discards them."""
+
+    def __init__(self, path, maxBuffered=256):
+        self.path = path
+        self.maxBuffered = maxBuffered
+        self._file = None
+        self._buffer = []
+        # Current session: number, image, annotation file, shape ids.
+        self._session = None
+        self._image = None
+        self._xml = None
+        self._ids = {}
+        self._nextId = 0
+        self._counter = 0
+        # Sessions handed to a background save, by annotation file.
+        self._saving = {}
+        # Sessions found by recover(), by image, and the one replayed.
+        self._found = OrderedDict()
+        self._recovered = {}
+        self._replayed = None
+        # Recovered sessions whose annotation file changed, by image.
+        self._dropped = {}
+
+    @staticmethod
+    def key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def _append(self, record):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.maxBuffered:
+            self.flush()
+
+    def _edit(self, record):
+        if self._session is None:
+            return
+        last = self._buffer[-1] if self._buffer else None
+        if record['t'] == 'move' and last is not None and \
+                last['t'] == 'move' and last['id'] == record['id']:
+            self._buffer[-1] = record
+        else:
+            self._append(record)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        self._file.write(''.join(json.dumps(record, separators=(',', ':')) + '\n'
+                                 for record in self._buffer))
+        self._file.flush()
+        self._buffer = []
+
+    def _truncate(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, 'w')
+        self._buffer = []
+
+    # Recovery.
+    def recover(self):
+        """Read the sessions a previous run left unsaved. Return their
+        images, the most recent last."""
+        self._found.clear()
+        if not os.path.isfile(self.path):
+            return []
+        sessions = OrderedDict()
+        current = None
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write of the last line.
+                    break
+                kind = record.get('t')
+                if kind == 'open':
+                    current = dict(record, edits=[])
+                    sessions[record['s']] = current
+                    self._counter = max(self._counter, record['s'] + 1)
+                elif kind in ('close', 'saved'):
+                    sessions.pop(record['s'], None)
+                elif current is not None:
+                    current['edits'].append(record)
+        for session in sessions.values():
+            if session['edits']:
+                self._found.pop(session['image'], None)
+                self._found[session['image']] = session
+        return list(self._found)
+
+    def restore(self):
+        """Replay the sessions found by recover() when their images are
+        opened again."""
+        self._recovered = dict(self._found)
+        self._found.clear()
+
+    def discardRecovered(self):
+        self._found.clear()
+        self._recovered = {}
+        self._dropped = {}
+
+    def recoveredXml(self, image):
+        """The annotation file the recovered edits of image were made
+        against, or None."""
+        session = self._recovered.get(image)
+        return session['xml'] if session else None
+
+    def isDropped(self, image):
+        """Whether the recovered edits of image could not be replayed."""
+        return image in self._dropped
+
+    def replay(self, image, shapes):
+        """Apply the recovered edits of image, if any, to the shapes read
+        from its annotation file, as (label, points, line_color,
+        fill_color, shape_type) tuples. Return the shape ids and the
+        resulting shapes."""
+        self._replayed = None
+        session = self._recovered.pop(image, None)
+        if session is None:
+            return range(len(shapes)), shapes
+        if session['n'] != len(shapes):
+            # The annotation file changed under the edits; leave them in
+            # the journal rather than apply them to the wrong shapes.
+            self._dropped[image] = session
+            return range(len(shapes)), shapes
+        result = OrderedDict(enumerate(shapes))
+        for record in session['edits']:
+            kind, id = record['t'], record['id']
+            if kind == 'add':
+                result[id] = (record['label'], map(tuple, record['points']),
+                              None, None, record['type'])
+            elif id not in result:
+                continue
+            elif kind == 'move':
+                label, _, line_color, fill_color, shape_type = result[id]
+                result[id] = (label, map(tuple, record['points']),
+                              line_color, fill_color, shape_type)
+            elif kind == 'label':
+                result[id] = (record['label'],) + tuple(result[id][1:])
+            elif kind == 'delete':
+                del result[id]
+        self._replayed = session
+        return result.keys(), result.values()
+
+    # Sessions.
+    def open(self, image, xml, ids, shapes):
+        """Start journaling the edits of image, whose shapes have the
+        given ids. Return True if recovered edits were replayed."""
+        self.endSession()
+        replayed, self._replayed = self._replayed, None
+        # Replayed edits are copied to the new session before their old
+        # one is closed, in the same file.
+        if not (self._saving or self._recovered or self._dropped or
+                replayed):
+            self._truncate()
+        n = replayed['n'] if replayed else len(ids)
+        self._session = self._counter
+        self._counter += 1
+        self._image = image
+        self._xml = self.key(xml)
+        self._append({'t': 'open', 's': self._session, 'image': image,
+                      'xml': xml, 'n': n})
+        edits = replayed['edits'] if replayed else []
+        for record in edits:
+            self._append(record)
+        if replayed:
+            # Its edits now belong to the new session.
+            self._append({'t': 'close', 's': replayed['s']})
+            self.flush()
+        self._ids = dict(zip(shapes, ids))
+        self._nextId = max([n - 1] + list(ids) +
+                           [record['id'] for record in edits]) + 1
+        return bool(replayed)
+
+    def endSession(self):
+        if self._session is None:
+            return
+        if not any(self._session in sessions
+                   for sessions in self._saving.values()):
+            self._append({'t': 'close', 's': self._session})
+        self._session = self._image = self._xml = None
+        self._ids = {}
+
+    def saving(self, xml):
+        """The edits of the current session are being saved to xml in the
+        background."""
+        if self._session is not None:
+            self._saving.setdefault(self.key(xml), []).append(self._session)
+
+    def saved(self, xml, shapes=None):
+        """xml has been written. With the shapes, it was saved from the
+        current session, which then starts over from them."""
+        key = self.key(xml)
+        for session in self._saving.pop(key, []):
+            self._append({'t': 'saved', 's': session})
+        if shapes is not None and self._session is not None and \
+                key == self._xml:
+            self._append({'t': 'saved', 's': self._session})
+            image, self._session = self._image, None
+            shapes = list(shapes)
+            self.open(image, xml, range(len(shapes)), shapes)
+        self.flush()
+
+    def close(self):
+        """End the journal; the file is removed unless it still holds
+        edits which may have to be recovered."""
+        self.endSession()
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if not (self._saving or self._recovered or self._dropped) and \
+                os.path.isfile(self.path):
+            os.remove(self.path)
+
+    # Edits.
+    def add(self, shape):
+        if self._session is None or shape in self._ids:
+            return
+        id = self._ids[shape] = self._nextId
+        self._nextId += 1
+        self._edit({'t': 'add', 'id': id, 'label': shape.label,
+                    'type': shape.shape_type,
+                    'points': shape.coords.tolist()})
+
+    def move(self, shape):
+        id = self._ids.get(shape)
+        if id is not None:
+            self._edit({'t': 'move', 'id': id,
+                        'points': shape.coords.tolist()})
+
+    def relabel(self, shape):
+        id = self._ids.get(shape)
+        if id is not None:
+            self._edit({'t': 'label', 'id': id, 'label': shape.label})
+
+    def delete(self, shape):
+        id = self._ids.pop(shape, None)
+        if id is not None:
+            self._edit({'t': 'delete', 'id': id})
+
+    def replace(self, old, new):
+        """new took the place of old (e.g. a moved copy)."""
+        if old in self._ids:
+            self._ids[new] = self._ids.pop(old)
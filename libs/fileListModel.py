@@ -0,0 +1,40 @@
+from PyQt4.QtGui import *
+from PyQt4.QtCore import *
+
+
+class FileListModel(QAbstractListModel):
+    """Read-only list model over an in-memory list of image paths.
+
+    Views ask for the rows they show, so no per-image item is created.
+    The list may grow behind the model's back (scanner batches, download
+    threads); sync() announces the new rows to the views."""
+
+    def __init__(self, paths=None, parent=None):
+        super(FileListModel, self).__init__(parent)
+        self._paths = paths if paths is not None else []
+        self._count = len(self._paths)
+
+    def setPaths(self, paths):
+        self.beginResetModel()
+        self._paths = paths
+        self._count = len(paths)
+        self.endResetModel()
+
+    def sync(self):
+        count = len(self._paths)
+        if count > self._count:
+            self.beginInsertRows(QModelIndex(), self._count, count - 1)
+            self._count = count
+            self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._count
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < self._count:
+            return QVariant()
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return QVariant(self._paths[index.row()])
+        return QVariant()
@@ -0,0 +1,275 @@
+import threading
+from collections import OrderedDict
+
+from PyQt4.QtGui import *
+from PyQt4.QtCore import *
+
+
+# Images above this many pixels on a side are never decoded whole: they
+# are previewed from a decode scaled down by the decoder, and zoomed into
+# through tiles (see tileCache).
+TILE_THRESHOLD = 16384
+# Fit for the preview of such an image when none is given.
+LARGE_PREVIEW_SIZE = QSize(4096, 4096)
+
+
+def needsTiles(size):
+    return max(size.width(), size.height()) > TILE_THRESHOLD
+
+
+def canDecodeRegions(filename):
+    """Whether the decoder of filename can read an area of the image
+    without decoding all of it: Qt's JPEG one can, its PNG and BMP ones
+    can't."""
+    return QImageReader(filename).supportsOption(QImageIOHandler.ClipRect)
+
+
+def decodeRegion(filename, rect, size):
+    """Decode the rect area of an image file, scaled to size by the
+    decoder."""
+    reader = QImageReader(filename)
+    reader.setClipRect(rect)
+    reader.setScaledSize(size)
+    return reader.read()
+
+
+def decodeLargeImage(filename, fullSize, maxSize):
+    """Preview of an image too large to decode whole, scaled to fit
+    maxSize: the coarsest level of its tiles, decoded the same way. A
+    null image if its format can't decode regions."""
+    if not canDecodeRegions(filename):
+        return QImage()
+    return decodeRegion(filename, QRect(QPoint(0, 0), fullSize),
+                        fullSize.scaled(maxSize, Qt.KeepAspectRatio))
+
+
+def readImageData(filename):
+    try:
+        with open(filename, 'rb') as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+def decodeImage(data, maxSize=None):
+    """Decode image data, scaled down to fit maxSize if it is larger.
+
+    The scaling happens inside the decoder (e.g. JPEG DCT scaling), so
+    it is much cheaper than decoding at full resolution. Return the image
+    and the full size of the encoded image; images which need tiles are
+    not decoded (see decodeLargeImage), and come back null."""
+    buf = QBuffer()
+    buf.setData(QByteArray(data))
+    buf.open(QIODevice.ReadOnly)
+    reader = QImageReader(buf)
+    fullSize = reader.size()
+    if needsTiles(fullSize):
+        return QImage(), fullSize
+    if maxSize is not None and fullSize.isValid() and \
+            (fullSize.width() > maxSize.width() or
+             fullSize.height() > maxSize.height()):
+        reader.setScaledSize(fullSize.scaled(maxSize, Qt.KeepAspectRatio))
+    image = reader.read()
+    if not fullSize.isValid():
+        fullSize = image.size()
+    return image, fullSize
+
+
+class LRUCache(object):
+    """Thread-safe least recently used cache bounded by the total cost
+    of its entries (e.g. bytes)."""
+
+    def __init__(self, maxCost):
+        self.maxCost = maxCost
+        self.totalCost = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None:
+                return default
+            # Re-insert to mark it as the most recently used entry.
+            self._items[key] = item
+            return item[0]
+
+    def put(self, key, value, cost):
+        if cost > self.maxCost:
+            return False
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.totalCost -= old[1]
+            self._items[key] = (value, cost)
+            self.totalCost += cost
+            while self.totalCost > self.maxCost:
+                _, (_, oldCost) = self._items.popitem(last=False)
+                self.totalCost -= oldCost
+        return True
+
+    def remove(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self.totalCost -= item[1]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.totalCost = 0
+
+
+class DecodeTask(QRunnable):
+
+    def __init__(self, prefetcher, filename):
+        super(DecodeTask, self).__init__()
+        self.prefetcher = prefetcher
+        self.filename = filename
+
+    def run(self):
+        try:
+            # The user may have moved on since the task was queued, and
+            # images needing tiles aren't decoded ahead.
+            if self.prefetcher.isWanted(self.filename) and \
+                    not needsTiles(QImageReader(self.filename).size()):
+                data = readImageData(self.filename)
+                if data is not None:
+                    image, fullSize = decodeImage(
+                        data, self.prefetcher.maxSize)
+                    if not image.isNull():
+                        self.prefetcher.put(
+                            self.filename, data, image, fullSize)
+        finally:
+            self.prefetcher.taskDone(self.filename)
+
+
+class ImagePrefetcher(object):
+    """Decode the images around the current position of an image list in
+    worker threads, keeping the results in a memory-bounded LRU cache.
+
+    Images are decoded to fit maxSize, if set."""
+
+    def __init__(self, maxBytes=512 * 1024 * 1024, ahead=3, behind=1,
+                 threads=2, maxSize=None):
+        self.cache = LRUCache(maxBytes)
+        self.maxSize = maxSize
+        self.ahead = ahead
+        self.behind = behind
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(
+            max(1, min(threads, QThread.idealThreadCount())))
+        self._pending = set()
+        self._wanted = set()
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """Return the cached (data, image, fullSize) of filename, or None."""
+        return self.cache.get(filename)
+
+    def put(self, filename, data, image, fullSize=None):
+        if fullSize is None:
+            fullSize = image.size()
+        self.cache.put(filename, (data, image, fullSize),
+                       len(data) + image.byteCount())
+
+    def isWanted(self, filename):
+        with self._lock:
+            return filename in self._wanted
+
+    def taskDone(self, filename):
+        with self._lock:
+            self._pending.discard(filename)
+
+    def prefetch(self, imageList, index):
+        """Schedule decoding of the neighbours of imageList[index]."""
+        count = len(imageList)
+        indices = range(index + 1, min(count, index + 1 + self.ahead)) + \
+            range(index - 1, max(-1, index - 1 - self.behind), -1)
+        wanted = [imageList[i] for i in indices]
+        with self._lock:
+            self._wanted = set(wanted)
+            self._wanted.add(imageList[index])
+            for filename in wanted:
+                if filename in self._pending or filename in self.cache:
+                    continue
+                self._pending.add(filename)
+                self.pool.start(DecodeTask(self, filename))
+
+    def clear(self):
+        with self._lock:
+            self._wanted = set()
+        self.cache.clear()
+
+
+class LoadTask(QRunnable):
+
+    def __init__(self, loader, filename, generation, maxSize=None,
+                 data=None):
+        super(LoadTask, self).__init__()
+        self.loader = loader
+        self.filename = filename
+        self.generation = generation
+        self.maxSize = maxSize
+        self.data = data
+
+    def run(self):
+        if not self.loader.isCurrent(self.generation):
+            return
+        data = self.data
+        fullSize = QSize()
+        if data is None:
+            fullSize = QImageReader(self.filename).size()
+        if needsTiles(fullSize):
+            # Not even read whole: shown from tiles.
+            image = decodeLargeImage(self.filename, fullSize,
+                                     self.maxSize or LARGE_PREVIEW_SIZE)
+        else:
+            if data is None:
+                data = readImageData(self.filename)
+            if data is not None:
+                image, fullSize = decodeImage(data, self.maxSize)
+            else:
+                image, fullSize = QImage(), QSize()
+        if self.loader.isCurrent(self.generation):
+            self.loader.imageLoaded.emit(
+                self.generation, self.filename, data, image, fullSize)
+
+
+class ImageLoader(QObject):
+    """Read and decode images on a thread pool.
+
+    Only the latest request counts: starting a new one cancels the
+    earlier ones, which are skipped if they have not started yet and
+    have their result dropped otherwise.
+
+    With a maxSize the image is decoded scaled down to fit it; passing
+    the data already read skips reading the file again."""
+    # generation, filename, data, image, full image size
+    imageLoaded = pyqtSignal(int, object, object, object, object)
+
+    def __init__(self, threads=2, parent=None):
+        super(ImageLoader, self).__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(
+            max(1, min(threads, QThread.idealThreadCount())))
+        self.generation = 0
+
+    def request(self, filename, maxSize=None, data=None):
+        self.generation += 1
+        self.pool.start(
+            LoadTask(self, filename, self.generation, maxSize, data))
+        return self.generation
+
+    def cancel(self):
+        self.generation += 1
+
+    def isCurrent(self, generation):
+        return generation == self.generation
@@ -0,0 +1,94 @@
+import threading
+
+
+class ImageList(list):
+    """List of image paths which keeps a path -> position map alongside,
+    so index() and membership tests take constant time.
+
+    append() and extend() are safe to call from the download threads."""
+
+    def __init__(self, paths=()):
+        super(ImageList, self).__init__()
+        self._positions = {}
+        self._lock = threading.RLock()
+        self.extend(paths)
+
+    def _reindex(self):
+        positions = {}
+        for i, path in enumerate(self):
+            positions.setdefault(path, i)
+        self._positions = positions
+
+    def append(self, path):
+        with self._lock:
+            self._positions.setdefault(path, len(self))
+            super(ImageList, self).append(path)
+
+    def extend(self, paths):
+        with self._lock:
+            for path in paths:
+                self.append(path)
+
+    def __iadd__(self, paths):
+        self.extend(paths)
+        return self
+
+    def index(self, path, *args):
+        with self._lock:
+            if args:
+                return super(ImageList, self).index(path, *args)
+            try:
+                return self._positions[path]
+            except KeyError:
+                raise ValueError('%r is not in list' % (path,))
+
+    def __contains__(self, path):
+        with self._lock:
+            return path in self._positions
+
+    # Any other mutation shifts positions, so the map is rebuilt after it.
+    def insert(self, i, path):
+        with self._lock:
+            super(ImageList, self).insert(i, path)
+            self._reindex()
+
+    def remove(self, path):
+        with self._lock:
+            super(ImageList, self).remove(path)
+            self._reindex()
+
+    def pop(self, *args):
+        with self._lock:
+            path = super(ImageList, self).pop(*args)
+            self._reindex()
+            return path
+
+    def sort(self, *args, **kwargs):
+        with self._lock:
+            super(ImageList, self).sort(*args, **kwargs)
+            self._reindex()
+
+    def reverse(self):
+        with self._lock:
+            super(ImageList, self).reverse()
+            self._reindex()
+
+    def __setitem__(self, i, value):
+        with self._lock:
+            super(ImageList, self).__setitem__(i, value)
+            self._reindex()
+
+    def __delitem__(self, i):
+        with self._lock:
+            super(ImageList, self).__delitem__(i)
+            self._reindex()
+
+    def __setslice__(self, i, j, paths):
+        with self._lock:
+            super(ImageList, self).__setslice__(i, j, paths)
+            self._reindex()
+
+    def __delslice__(self, i, j):
+        with self._lock:
+            super(ImageList, self).__delslice__(i, j)
+            self._reindex()
@@ -0,0 +1,229 @@
+import json
+import os
+import threading
+
+from imageScanner import IMAGE_EXTENSIONS, listDir
+
+
+def manifestPath(saveDir):
+    """The manifest of an image folder sits next to its annotation folder,
+    e.g. Annotation/images_1.manifest.json."""
+    return saveDir.rstrip('/\\') + '.manifest.json'
+
+
+class ImageManifest(object):
+    """On-disk cache of an image tree, so reopening a folder only rescans
+    the directories that changed since the last time.
+
+    Every directory is stored with its mtime, its sub-directories and one
+    record per image: [name, size, mtime, width, height, annotated].
+    Width and height are 0 until the image has been opened once.
+
+    The file is JSON lines: a header, then one [path, mtime, dirs, files]
+    line per directory, in the order the last scan visited them. load()
+    only reads the header; directories are parsed as the scan asks for
+    them, so the first ones are listed without reading the whole file."""
+    version = 2
+    NAME, SIZE, MTIME, WIDTH, HEIGHT, ANNOTATED = range(6)
+
+    def __init__(self, path, annotationDir=None):
+        self.path = path
+        self.annotationDir = annotationDir
+        self.dirs = {}
+        self.annotationMtime = None
+        self.dirty = False
+        self._visited = set()
+        self._visitOrder = []
+        self._records = {}
+        self._annotations = None
+        self._refreshAnnotations = True
+        # The manifest being read back, positioned at the next directory.
+        self._file = None
+        self._lock = threading.RLock()
+
+    def load(self):
+        try:
+            f = open(self.path, 'rb')
+        except (IOError, OSError):
+            return False
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = {}
+        if not isinstance(header, dict) or \
+                header.get('version') != self.version:
+            f.close()
+            return False
+        with self._lock:
+            self._closeFile()
+            self.dirs = {}
+            self._records.clear()
+            self.annotationMtime = header.get('annotationMtime')
+            # Annotation flags only need refreshing if the annotation
+            # folder changed since the manifest was written.
+            self._refreshAnnotations = \
+                self.annotationMtime != self._annotationDirMtime()
+            self._file = f
+        return True
+
+    def _closeFile(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _entry(self, path):
+        """The entry of path, reading the manifest up to it if it hasn't
+        been yet; path None reads all of it. Call with the lock held."""
+        entry = self.dirs.get(path)
+        while entry is None and self._file is not None:
+            line = self._file.readline()
+            try:
+                dirPath, mtime, dirs, files = json.loads(line)
+            except ValueError:
+                # End of the file, or a torn last line.
+                self._closeFile()
+                break
+            if dirPath not in self.dirs:
+                self.dirs[dirPath] = dict(mtime=mtime, dirs=dirs,
+                                          files=files)
+                if dirPath == path:
+                    entry = self.dirs[dirPath]
+        return entry
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            # Keep the directories the scan did not get to.
+            self._entry(None)
+            header = dict(version=self.version,
+                          annotationMtime=self._annotationDirMtime())
+            paths = [path for path in self._visitOrder if path in self.dirs]
+            paths.extend(path for path in self.dirs
+                         if path not in self._visited)
+            tmpPath = self.path + '.tmp'
+            try:
+                with open(tmpPath, 'wb') as f:
+                    f.write(json.dumps(header) + '\n')
+                    for path in paths:
+                        entry = self.dirs[path]
+                        f.write(json.dumps(
+                            [path, entry['mtime'], entry['dirs'],
+                             entry['files']], separators=(',', ':')) + '\n')
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                os.rename(tmpPath, self.path)
+            except (IOError, OSError):
+                return
+            self.dirty = False
+
+    def saveInBackground(self):
+        """Save from a thread of its own, for a manifest the GUI is done
+        with. The interpreter waits for it before exiting."""
+        if self.dirty:
+            threading.Thread(target=self.save).start()
+
+    def prune(self):
+        """Forget the directories which were not visited by the last scan."""
+        with self._lock:
+            self._closeFile()
+            for path in set(self.dirs) - self._visited:
+                del self.dirs[path]
+                self.dirty = True
+
+    def _annotationDirMtime(self):
+        if self.annotationDir is None:
+            return None
+        try:
+            return os.stat(self.annotationDir).st_mtime
+        except OSError:
+            return None
+
+    def _annotated(self, name):
+        if self._annotations is None:
+            self._annotations = set()
+            if self.annotationDir is not None:
+                try:
+                    self._annotations = set(os.listdir(self.annotationDir))
+                except OSError:
+                    pass
+        return os.path.splitext(name)[0] + '.xml' in self._annotations
+
+    def listDir(self, path):
+        """Same as imageScanner.listDir, but only rescans path when its
+        mtime differs from the recorded one."""
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return [], []
+        with self._lock:
+            if path not in self._visited:
+                self._visited.add(path)
+                self._visitOrder.append(path)
+            entry = self._entry(path)
+            if entry is not None and entry['mtime'] == mtime:
+                records = entry['files']
+                if self._refreshAnnotations:
+                    for record in records:
+                        annotated = self._annotated(record[self.NAME])
+                        if record[self.ANNOTATED] != annotated:
+                            record[self.ANNOTATED] = annotated
+                            self.dirty = True
+                return [record[self.NAME] for record in records], \
+                    entry['dirs']
+            previous = {}
+            if entry is not None:
+                previous = dict((record[self.NAME], record)
+                                for record in entry['files'])
+        files, dirs = listDir(path)
+        records = []
+        for name in files:
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            try:
+                st = os.stat(os.path.join(path, name))
+            except OSError:
+                continue
+            width = height = 0
+            old = previous.get(name)
+            if old is not None and old[self.SIZE] == st.st_size and \
+                    old[self.MTIME] == st.st_mtime:
+                width, height = old[self.WIDTH], old[self.HEIGHT]
+            records.append([name, st.st_size, st.st_mtime, width, height,
+                            self._annotated(name)])
+        with self._lock:
+            self.dirs[path] = dict(mtime=mtime, dirs=dirs, files=records)
+            self._records.pop(path, None)
+            self.dirty = True
+        return [record[self.NAME] for record in records], dirs
+
+    def record(self, imagePath):
+        """Return the record of imagePath, or None if it is unknown."""
+        dirPath, name = os.path.split(imagePath)
+        with self._lock:
+            records = self._records.get(dirPath)
+            if records is None:
+                # Images are only known once the scan listed their
+                # directory, so there is no need to read further here.
+                entry = self.dirs.get(dirPath)
+                if entry is None:
+                    return None
+                records = dict((record[self.NAME], record)
+                               for record in entry['files'])
+                self._records[dirPath] = records
+            return records.get(name)
+
+    def setImageSize(self, imagePath, width, height):
+        with self._lock:
+            record = self.record(imagePath)
+            if record is not None and \
+                    (record[self.WIDTH], record[self.HEIGHT]) != (width, height):
+                record[self.WIDTH], record[self.HEIGHT] = width, height
+                self.dirty = True
+
+    def setAnnotated(self, imagePath, annotated=True):
+        with self._lock:
+            record = self.record(imagePath)
+            if record is not None and record[self.ANNOTATED] != annotated:
+                record[self.ANNOTATED] = annotated
+                self.dirty = True
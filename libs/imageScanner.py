@@ -0,0 +1,111 @@
+import os
+import time
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+from PyQt4.QtCore import *
+
+IMAGE_EXTENSIONS = ('.jpeg', '.jpg', '.png', '.bmp')
+
+
+def listDir(path):
+    """Return the file and sub-directory names of path.
+
+    Like os.walk, symlinked directories are not descended into and
+    unreadable directories are skipped."""
+    files, dirs = [], []
+    try:
+        if scandir is not None:
+            for entry in scandir(path):
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        dirs.append(entry.name)
+                else:
+                    files.append(entry.name)
+        else:
+            for name in os.listdir(path):
+                fullPath = os.path.join(path, name)
+                if os.path.isdir(fullPath):
+                    if not os.path.islink(fullPath):
+                        dirs.append(name)
+                else:
+                    files.append(name)
+    except OSError:
+        pass
+    return files, dirs
+
+
+def iterImages(folderPath, extensions=IMAGE_EXTENSIONS, listDir=listDir):
+    """Yield the absolute paths of the images under folderPath, in the
+    case-insensitive order of the full paths.
+
+    Every directory is sorted on its own as it is visited: giving
+    directories a trailing separator in the sort key makes this
+    depth-first walk produce the same order as sorting the whole list."""
+    root = os.path.abspath(folderPath)
+    files, dirs = listDir(root)
+    entries = [(name.lower(), name, False) for name in files
+               if name.lower().endswith(extensions)]
+    entries.extend((name.lower() + os.sep, name, True) for name in dirs)
+    entries.sort()
+    for _, name, isDir in entries:
+        path = os.path.join(root, name)
+        if isDir:
+            for image in iterImages(path, extensions, listDir):
+                yield image
+        else:
+            yield path
+
+
+class ImageScanner(QThread):
+    """Walk a directory tree in the background and hand the images found
+    to the GUI in batches, already in their final order.
+
+    With a manifest, unchanged directories are read from it instead of
+    the disk: it is loaded first, and saved once the scan completes."""
+    imagesFound = pyqtSignal(object)
+    scanFinished = pyqtSignal(int)
+
+    def __init__(self, folderPath, manifest=None, batchSize=1000,
+                 interval=0.25, parent=None):
+        super(ImageScanner, self).__init__(parent)
+        self.folderPath = folderPath
+        self.manifest = manifest
+        self.batchSize = batchSize
+        self.interval = interval
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def run(self):
+        if self.manifest is not None:
+            self.manifest.load()
+        batch = []
+        count = 0
+        lastEmit = time.time()
+        scanDir = listDir if self.manifest is None else self.manifest.listDir
+        for path in iterImages(self.folderPath, listDir=scanDir):
+            if self._stopped:
+                return
+            batch.append(path)
+            count += 1
+            # The first image is sent on its own so it can be shown
+            # while the rest of the tree is still being walked.
+            if count == 1 or len(batch) >= self.batchSize or \
+                    time.time() - lastEmit >= self.interval:
+                self.imagesFound.emit(batch)
+                batch = []
+                lastEmit = time.time()
+        if batch:
+            self.imagesFound.emit(batch)
+        if self.manifest is not None:
+            self.manifest.prune()
+            self.manifest.save()
+        self.scanFinished.emit(count)
@@ -0,0 +1,47 @@
+from PyQt4.QtGui import *
+from PyQt4.QtCore import *
+
+from imageCache import LRUCache
+
+
+class LabelCache(object):
+    """Laid out label texts, so that drawing a label is mostly a blit.
+
+    Texts are kept as QStaticText per (text, font), with the ascent of
+    the font: drawText places text on its baseline, drawStaticText by
+    its top left corner."""
+
+    def __init__(self, maxCount=4096):
+        self.cache = LRUCache(maxCount)
+        self.rects = LRUCache(maxCount)
+
+    def get(self, text, font, transform):
+        key = (text, font.key())
+        entry = self.cache.get(key)
+        if entry is None:
+            static = QStaticText(text)
+            static.setTextFormat(Qt.PlainText)
+            static.setPerformanceHint(QStaticText.AggressiveCaching)
+            static.prepare(transform, font)
+            entry = (static, QFontMetricsF(font).ascent())
+            self.cache.put(key, entry, 1)
+        return entry
+
+    def boundingRect(self, text, font):
+        """QFontMetricsF(font).boundingRect(text), relative to the start
+        of the baseline."""
+        key = (text, font.key())
+        rect = self.rects.get(key)
+        if rect is None:
+            rect = QFontMetricsF(font).boundingRect(text)
+            self.rects.put(key, rect, 1)
+        return rect
+
+    def draw(self, painter, point, text):
+        """Draw text with its baseline starting at point, like
+        painter.drawText(point, text)."""
+        static, ascent = self.get(text, painter.font(), painter.transform())
+        painter.drawStaticText(QPointF(point.x(), point.y() - ascent), static)
+
+
+labelCache = LabelCache()
@@ -44,7 +44,6 @@ class LabelFile(object):
             points = shape['points']
             label = shape['label']
             if shape['shape_type'] == 0:
-                print 'add rects'
                 bndbox = LabelFile.convertPoints2BndBox(points)
                 writer.addBndBox(
                     bndbox[0],
@@ -53,7 +52,6 @@ class LabelFile(object):
                     bndbox[3],
                     label)
             if shape['shape_type'] == 1:
-                print 'add polygons'
                 writer.addPolygon(points, label)
 
             bSave = True
@@ -1,5 +1,7 @@
 from math import sqrt
 
+import numpy as np
+
 from PyQt4.QtGui import *
 from PyQt4.QtCore import *
 
@@ -63,6 +65,37 @@ def distance(p):
     return sqrt(p.x() * p.x() + p.y() * p.y())
 
 
+def simplifyPolyline(coords, tolerance):
+    """Douglas-Peucker simplification of an N x 2 array of points: drop
+    the points that lie within tolerance of the segment joining the
+    points kept around them. Return the rows kept."""
+    count = len(coords)
+    if count < 3:
+        return coords
+    keep = np.zeros(count, bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        a = coords[first]
+        dx, dy = coords[last] - a
+        rel = coords[first + 1:last] - a
+        length = sqrt(dx * dx + dy * dy)
+        if length:
+            d = np.abs(dy * rel[:, 0] - dx * rel[:, 1]) / length
+        else:
+            d = np.hypot(rel[:, 0], rel[:, 1])
+        i = int(d.argmax())
+        if d[i] > tolerance:
+            index = first + 1 + i
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return coords[keep]
+
+
 def fmtShortcut(text):
     mod, key = text.split('+', 1)
     return '<b>%s</b>+<b>%s</b>' % (mod, key)
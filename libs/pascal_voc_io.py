@@ -1,8 +1,16 @@
+import os
 import sys
-from xml.etree import ElementTree
-from xml.etree.ElementTree import Element, SubElement
-from xml.dom import minidom
+from collections import namedtuple
+from multiprocessing import Pool
+
 from lxml import etree
+from lxml.etree import Element, SubElement
+
+# A parsed annotation file. objects holds (label, coords) pairs, where
+# coords is (xmin, ymin, xmax, ymax) for RECT files and the flattened
+# x, y of the points for POLYGON ones.
+VocRecord = namedtuple('VocRecord',
+                       'path filename width height shape_type objects')
 
 
 class PascalVocWriter:
@@ -27,9 +35,8 @@ class PascalVocWriter:
         """
             Return a pretty-printed XML string for the Element.
         """
-        rough_string = ElementTree.tostring(elem, 'utf8')
-        root = etree.fromstring(rough_string)
-        return etree.tostring(root,pretty_print=True)
+        # The tree is built with lxml, which indents while serializing.
+        return etree.tostring(elem, pretty_print=True)
 
     def genXML(self):
         """
@@ -85,14 +92,9 @@ class PascalVocWriter:
         self.boxlist.append(bndbox)
 
     def addPolygon(self, shape, name):
-        polygon = {}
-        i = 0
-        for point in shape:
-            polygon[i] = point
-            i = i + 1
+        polygon = dict(enumerate(shape))
         polygon['name'] = name
         polygon['point_num'] = str(len(shape))
-        print 'point num is ', str(len(shape))
         self.boxlist.append(polygon)
 
     def appendObjects(self, top):
@@ -121,21 +123,16 @@ class PascalVocWriter:
                 polygon = SubElement(object_item, 'polygon')
                 for i in xrange(int(each_object['point_num'])):
                     point = SubElement(polygon, 'point' + str(i))
-                    point.text = str(
-                        int(each_object[i][0])) + ',' + str(int(each_object[i][1]))
-                    print i, point.text
+                    point.text = '%d,%d' % (each_object[i][0],
+                                            each_object[i][1])
 
     def save(self, targetFile=None):
         root = self.genXML()
         self.appendObjects(root)
-        out_file = None
         if targetFile is None:
-            out_file = open(self.filename + '.xml', 'w')
-        else:
-            out_file = open(targetFile, 'w')
-        out_file.write(self.prettify(root))
-        # out_file.write(root)
-        out_file.close()
+            targetFile = self.filename + '.xml'
+        with open(targetFile, 'w') as out_file:
+            out_file.write(self.prettify(root))
 
 
 class PascalVocReader:
@@ -171,38 +168,88 @@ class PascalVocReader:
 
     def parseXML(self):
         assert self.filepath.endswith('.xml'), "Unsupport file format"
-        parser = etree.XMLParser(encoding='utf-8')
-        xmltree = ElementTree.parse(self.filepath,parser=parser).getroot()
-        filename = xmltree.find('filename').text
-        if xmltree.find('shape_type') is not None:
-            self.shape_type = xmltree.find('shape_type').text
-        else:
-            self.shape_type = 'RECT'
-        self.image_size.append(int(xmltree.find('size').find('width').text))
-        self.image_size.append(int(xmltree.find('size').find('height').text))
+        record = readVocFile(self.filepath)
+        self.shape_type = record.shape_type
+        self.image_size.append(record.width)
+        self.image_size.append(record.height)
         if self.shape_type == 'RECT':
-            for object_iter in xmltree.findall('object'):
-                rects = []
-                bndbox = object_iter.find("bndbox")
-                rects.append([int(it.text) for it in bndbox])
-                label = object_iter.find('name').text
-                for rect in rects:
-                    self.addShape(label, rect)
+            for label, rect in record.objects:
+                self.addShape(label, rect)
             return True
         elif self.shape_type == 'POLYGON':
-            for object_iter in xmltree.findall('object'):
-                points = []
-                polygons = object_iter.find("polygon")
-                label = object_iter.find('name').text
-                for point in polygons:
-                    point = point.text.split(',')
-                    point = [int(dot) for dot in point]
-                    points.append(point)
-                self.addPolygonShape(label, points)
+            for label, coords in record.objects:
+                self.addPolygonShape(label, zip(coords[::2], coords[1::2]))
         else:
             print 'unsupportable shape type'
 
 
+def readVocFile(path):
+    """
+        Read an annotation file in a single streaming pass.
+    """
+    filename = width = height = None
+    shape_type = 'RECT'
+    boxes, polygons = [], []
+    for _, elem in etree.iterparse(path, events=('end',)):
+        tag = elem.tag
+        if tag == 'object':
+            label = rect = coords = None
+            for child in elem:
+                if child.tag == 'name':
+                    label = child.text
+                elif child.tag == 'bndbox':
+                    rect = tuple(int(it.text) for it in child)
+                elif child.tag == 'polygon':
+                    coords = []
+                    for point in child:
+                        coords.extend(int(dot) for dot in point.text.split(','))
+            if rect is not None:
+                boxes.append((label, rect))
+            if coords is not None:
+                polygons.append((label, tuple(coords)))
+            elem.clear()
+        elif tag == 'filename':
+            filename = elem.text
+        elif tag == 'shape_type':
+            shape_type = elem.text
+        elif tag == 'width':
+            width = int(elem.text)
+        elif tag == 'height':
+            height = int(elem.text)
+    objects = polygons if shape_type == 'POLYGON' else boxes
+    return VocRecord(path, filename, width, height, shape_type, objects)
+
+
+def _readVocFile(path):
+    try:
+        return path, readVocFile(path), None
+    except Exception as e:
+        return path, None, '%s: %s' % (type(e).__name__, e)
+
+
+def readVocDir(dirPath, processes=None, chunksize=64):
+    """
+        Read every annotation file of a directory (e.g. Annotation/<dir>)
+        on a process pool. Return the VocRecords sorted by path, and a
+        dict of the error of each file which could not be read.
+    """
+    paths = sorted(os.path.join(dirPath, name) for name in os.listdir(dirPath)
+                   if name.lower().endswith('.xml'))
+    if len(paths) <= chunksize or processes == 1:
+        results = map(_readVocFile, paths)
+    else:
+        pool = Pool(processes)
+        try:
+            results = pool.map(_readVocFile, paths, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+    records = [record for _, record, _ in results if record is not None]
+    errors = dict((path, error) for path, _, error in results
+                  if error is not None)
+    return records, errors
+
+
 # tempParseReader = PascalVocReader('test.xml')
 # print tempParseReader.getShapes()
 """
@@ -0,0 +1,90 @@
+import os
+import threading
+from collections import OrderedDict
+
+from PyQt4.QtCore import *
+
+
+class SaveQueue(QThread):
+    """Write-behind queue running save jobs on a background thread.
+
+    A job is a callable holding a snapshot of what to write, queued under
+    the path it writes. Queueing a path which is already waiting replaces
+    its job, so only the latest version of a file gets written. Results
+    are reported through the saved and saveFailed signals, and the paths
+    written are also kept for takeSaved(), which does not depend on the
+    signals being delivered (e.g. once the event loop has stopped)."""
+    saved = pyqtSignal(object)
+    saveFailed = pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super(SaveQueue, self).__init__(parent)
+        self._jobs = OrderedDict()
+        self._current = None
+        self._saved = []
+        self._stopped = False
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def submit(self, path, job):
+        key = self.key(path)
+        with self._cond:
+            self._jobs[key] = (path, job)
+            self._cond.notify_all()
+        if not self.isRunning():
+            self._stopped = False
+            self.start()
+
+    def isPending(self, path=None):
+        with self._cond:
+            return self._isPending(path)
+
+    def _isPending(self, path):
+        if path is None:
+            return bool(self._jobs) or self._current is not None
+        key = self.key(path)
+        return key in self._jobs or key == self._current
+
+    def takeSaved(self):
+        """Return the paths written since the last call, oldest first."""
+        with self._cond:
+            saved, self._saved = self._saved, []
+        return saved
+
+    def flush(self, path=None):
+        """Wait until path (or every queued file) has been written."""
+        with self._cond:
+            while self._isPending(path) and self.isRunning():
+                self._cond.wait(0.1)
+
+    def stop(self):
+        """Write what is left in the queue and end the thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._jobs and not self._stopped:
+                    self._cond.wait()
+                if not self._jobs:
+                    return
+                key, (path, job) = self._jobs.popitem(last=False)
+                self._current = key
+            try:
+                job()
+            except Exception as e:
+                self.saveFailed.emit(path, unicode(e))
+            else:
+                with self._cond:
+                    self._saved.append(path)
+                self.saved.emit(path)
+            finally:
+                with self._cond:
+                    self._current = None
+                    self._cond.notify_all()
@@ -24,12 +24,22 @@ class label_mask_writer:
         self.labels = []
         self.shapes = []
 
-    def save_mask_image(self, shapes):
+    def save_mask_image(self, shapes, compress_level=None):
+        '''
+        draw all the shapes into the mask and write it once
+        :param compress_level: zlib level of the png, 0-9, lower is faster;
+            the PIL default (6) if None
+        '''
         for shape in shapes:
             self.add_mask_label(shape['label'])
             self.add_shape_points(shape['points'])
-            image = self.get_mask_image()
-            image.save(self.save_file_path, 'PNG')
+        if not self.shapes:
+            return
+        image = self.get_mask_image()
+        options = {}
+        if compress_level is not None:
+            options['compress_level'] = compress_level
+        image.save(self.save_file_path, 'PNG', **options)
 
     def add_mask_label(self, label):
         self.labels.append(label)
@@ -46,12 +56,8 @@ class label_mask_writer:
         mask_bg = Image.new('L',(self.image_width,self.image_height))
         mask_draw = ImageDraw.Draw(mask_bg)
         if self.labels:
-            index = 0
-            for label in self.labels:
-                color = self.label_num_dict[label]
-                vertex = self.shapes[index]
-                mask_draw.polygon(vertex,color)
-                index += 1
+            for label, vertex in zip(self.labels, self.shapes):
+                mask_draw.polygon(vertex, self.label_num_dict[label])
         else:
             logging.error('there are no shapes to save !')
         return mask_bg
@@ -1,10 +1,15 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+from math import ceil, log
+
+import numpy as np
+
 from PyQt4.QtGui import *
 from PyQt4.QtCore import *
 
-from lib import distance
+from lib import simplifyPolyline
+from labelCache import labelCache
 
 DEFAULT_LINE_COLOR = QColor(0, 255, 0, 128)
 DEFAULT_FILL_COLOR = QColor(255, 0, 0, 10)
@@ -15,9 +20,21 @@ DEFAULT_HVERTEX_FILL_COLOR = QColor(255, 0, 0)
 
 
 class Shape(object):
+    # Instances override the class-level colors through __dict__, which
+    # is only allocated for the shapes which do.
+    __slots__ = ('label', '_coords', 'fill', 'selected', 'shape_type',
+                 'max_piont_num', '_highlightIndex', '_highlightMode',
+                 '_highlightSettings', '_closed', '_path', '_linePath',
+                 '_vertexPath', '_vertexKey', '_boundingRect',
+                 '_displayPath', '_displayBucket', '_fillPolygon',
+                 '__dict__')
+
     P_SQUARE, P_ROUND = range(2)
     RECT_SHAPE, POLYGON_SHAPE = range(2)
     MOVE_VERTEX, NEAR_VERTEX = range(2)
+    # How much of a shape paint() draws: everything, everything but the
+    # label, the outline only, or a single point.
+    FULL_DETAIL, VERTEX_DETAIL, OUTLINE_DETAIL, POINT_DETAIL = range(4)
 
     # The following class variables influence the drawing
     # of _all_ shape objects.
@@ -30,10 +47,18 @@ class Shape(object):
     point_type = P_ROUND
     point_size = 8
     scale = 1.0
+    # Outlines with more points than this are simplified for display
+    # when drawn without their vertices.
+    simplify_min_points = 32
+    # Outlines with more than a point per dense_spacing screen pixels of
+    # their size are dense: their vertices can't be told apart.
+    dense_spacing = 2
 
     def __init__(self, label=None, shape_type=0, line_color=None):
         self.label = label
-        self.points = []
+        # One (x, y) row per point.
+        self._coords = np.empty((0, 2))
+        self._invalidate()
         self.fill = False
         self.selected = False
         self.shape_type = self.RECT_SHAPE
@@ -56,6 +81,36 @@ class Shape(object):
             # is used for drawing the pending line a different color.
             self.line_color = line_color
 
+    def _invalidate(self):
+        # Drop the geometry cached from the points.
+        self._path = None
+        self._linePath = None
+        self._vertexPath = None
+        self._vertexKey = None
+        self._boundingRect = None
+        self._displayPath = None
+        self._displayBucket = None
+        self._fillPolygon = None
+
+    @property
+    def points(self):
+        """The points as a new list of QPointF."""
+        return [QPointF(x, y) for x, y in self._coords.tolist()]
+
+    @points.setter
+    def points(self, points):
+        self.coords = [(p.x(), p.y()) for p in points]
+
+    @property
+    def coords(self):
+        """The points as an N x 2 array of coordinates."""
+        return self._coords
+
+    @coords.setter
+    def coords(self, coords):
+        self._coords = np.array(coords, dtype=float).reshape(-1, 2)
+        self._invalidate()
+
     def set_shape_type(self, type):
         self.shape_type = type
 
@@ -63,9 +118,10 @@ class Shape(object):
         return self.shape_type
 
     def close(self):
-        assert len(self.points) > 2
+        assert len(self) > 2
         self._closed = True
-        print len(self.points)
+        self._invalidate()
+        print len(self)
 
     def isRect(self):
         return self.shape_type == self.RECT_SHAPE
@@ -74,19 +130,24 @@ class Shape(object):
         return self.shape_type == self.POLYGON_SHAPE
 
     def reachMaxPoints(self):
-        if len(self.points) >= self.max_piont_num:
+        if len(self) >= self.max_piont_num:
             return True
         return False
 
     def addPoint(self, point):
-        if self.points and point == self.points[0]:
+        if len(self) and point == self[0]:
             self.close()
         else:
-            self.points.append(point)
+            self._coords = np.append(
+                self._coords, [[point.x(), point.y()]], axis=0)
+            self._invalidate()
 
     def popPoint(self):
-        if self.points:
-            return self.points.pop()
+        if len(self):
+            point = self[-1]
+            self._coords = self._coords[:-1]
+            self._invalidate()
+            return point
         return None
 
     def isClosed(self):
@@ -94,54 +155,109 @@ class Shape(object):
 
     def setOpen(self):
         self._closed = False
+        self._invalidate()
+
+    def vertexColor(self):
+        if self._highlightIndex is not None:
+            return self.hvertex_fill_color
+        return self.vertex_fill_color
 
-    def paint(self, painter):
+    def paint(self, painter, detail=FULL_DETAIL):
         color = self.select_line_color if self.selected else self.line_color
         pen = QPen(color)
+        if detail == self.POINT_DETAIL:
+            # Too small to make out: a dot where the shape is.
+            pen.setWidthF(3.0 / self.scale)
+            painter.setPen(pen)
+            painter.drawPoint(self.boundingRect().center())
+            return
         # Try using integer sizes for smoother drawing(?)
         pen.setWidth(max(1, int(round(2.0 / self.scale))))
         painter.setPen(pen)
 
-        line_path = QPainterPath()
-        vrtx_path = QPainterPath()
-
-        line_path.moveTo(self.points[0])
-        # Uncommenting the following line will draw 2 paths
-        # for the 1st vertex, and make it non-filled, which
-        # may be desirable.
-        #self.drawVertex(vrtx_path, 0)
-
-        for i, p in enumerate(self.points):
-            line_path.lineTo(p)
-            self.drawVertex(vrtx_path, i)
-        if self.isClosed():
-            line_path.lineTo(self.points[0])
-        painter.drawPath(line_path)
-        painter.drawPath(vrtx_path)
-        painter.fillPath(vrtx_path, self.vertex_fill_color)
+        if detail == self.OUTLINE_DETAIL:
+            line_path = self.displayPath()
+            painter.drawPath(line_path)
+        else:
+            line_path = self.linePath()
+            vrtx_path = self.vertexPath()
+            painter.drawPath(line_path)
+            painter.drawPath(vrtx_path)
+            painter.fillPath(vrtx_path, self.vertexColor())
         if self.fill:
             color = self.select_fill_color if self.selected else self.fill_color
             painter.fillPath(line_path, color)
-        if self.label is not None and self.shape_type == self.RECT_SHAPE:
+        if detail == self.FULL_DETAIL and self.label is not None and \
+                self.shape_type == self.RECT_SHAPE:
             '''
             painter.setBrush(QColor(255,255,255))
             top_left_point = QPointF(self.points[0].x(),self.points[0].y()-50)
             label_bg = QRectF(top_left_point,self.points[3])
             painter.drawRect(label_bg)
             '''
-            painter.drawText(self.points[0], self.label)
+            labelCache.draw(painter, self[0], self.label)
+
+    def linePath(self):
+        """The outline drawn and filled by paint, cached until the points
+        change."""
+        if self._linePath is None:
+            polygon = self.polygon()
+            if self.isClosed():
+                polygon.append(polygon[0])
+            path = QPainterPath()
+            path.addPolygon(polygon)
+            self._linePath = path
+        return self._linePath
+
+    def isDense(self):
+        """Whether the outline has many more points than it has screen
+        pixels to show them."""
+        if len(self) <= self.simplify_min_points:
+            return False
+        rect = self.boundingRect()
+        size = max(rect.width(), rect.height()) * self.scale
+        return size < len(self) * self.dense_spacing
+
+    def displayPath(self):
+        """The outline simplified to within half a screen pixel. It is
+        cached per power of two of the scale, so zooming doesn't redo it
+        at every step."""
+        if len(self) <= self.simplify_min_points:
+            return self.linePath()
+        bucket = int(ceil(log(self.scale, 2)))
+        if self._displayPath is None or self._displayBucket != bucket:
+            coords = simplifyPolyline(self._coords, 0.5 / 2 ** bucket)
+            polygon = QPolygonF([QPointF(x, y) for x, y in coords.tolist()])
+            if self.isClosed():
+                polygon.append(polygon[0])
+            path = QPainterPath()
+            path.addPolygon(polygon)
+            self._displayPath = path
+            self._displayBucket = bucket
+        return self._displayPath
+
+    def vertexPath(self):
+        """The vertex markers, cached until the points, the scale or the
+        highlighted vertex change."""
+        key = (self.scale, self._highlightIndex, self._highlightMode)
+        if self._vertexPath is None or self._vertexKey != key:
+            path = QPainterPath()
+            # Calling drawVertex for the 1st vertex twice will draw 2
+            # paths for it, and make it non-filled, which may be
+            # desirable.
+            for i in xrange(len(self)):
+                self.drawVertex(path, i)
+            self._vertexPath = path
+            self._vertexKey = key
+        return self._vertexPath
 
     def drawVertex(self, path, i):
         d = self.point_size / self.scale
         shape = self.point_type
-        point = self.points[i]
+        point = self[i]
         if i == self._highlightIndex:
             size, shape = self._highlightSettings[self._highlightMode]
             d *= size
-        if self._highlightIndex is not None:
-            self.vertex_fill_color = self.hvertex_fill_color
-        else:
-            self.vertex_fill_color = Shape.vertex_fill_color
         if shape == self.P_SQUARE:
             path.addRect(point.x() - d / 2, point.y() - d / 2, d, d)
         elif shape == self.P_ROUND:
@@ -150,28 +266,57 @@ class Shape(object):
             assert False, "unsupported vertex shape"
 
     def nearestVertex(self, point, epsilon):
-        for i, p in enumerate(self.points):
-            if distance(p - point) <= epsilon:
-                return i
+        """The index of the first vertex within epsilon of point."""
+        d = np.hypot(self._coords[:, 0] - point.x(),
+                     self._coords[:, 1] - point.y())
+        near = np.flatnonzero(d <= epsilon)
+        if len(near):
+            return int(near[0])
         return None
 
     def containsPoint(self, point):
         return self.makePath().contains(point)
 
     def makePath(self):
-        path = QPainterPath(self.points[0])
-        for p in self.points[1:]:
-            path.lineTo(p)
-        return path
+        if self._path is None:
+            path = QPainterPath()
+            path.addPolygon(self.polygon())
+            self._path = path
+        return self._path
+
+    def polygon(self):
+        return QPolygonF(self.points)
+
+    def fillPolygon(self):
+        """The points as a polygon wound clockwise (in screen
+        coordinates), so that fills combined with the winding rule do not
+        cancel out where shapes overlap."""
+        if self._fillPolygon is None:
+            x, y = self._coords[:, 0], self._coords[:, 1]
+            area = np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)
+            polygon = self.polygon()
+            if area < 0:
+                polygon = QPolygonF(self.points[::-1])
+            self._fillPolygon = polygon
+        return self._fillPolygon
 
     def boundingRect(self):
-        return self.makePath().boundingRect()
+        if self._boundingRect is None:
+            if len(self):
+                (x1, y1), (x2, y2) = (self._coords.min(axis=0),
+                                      self._coords.max(axis=0))
+                self._boundingRect = QRectF(x1, y1, x2 - x1, y2 - y1)
+            else:
+                self._boundingRect = QRectF()
+        return self._boundingRect
 
     def moveBy(self, offset):
-        self.points = [p + offset for p in self.points]
+        self._coords += (offset.x(), offset.y())
+        self._invalidate()
 
     def moveVertexBy(self, i, offset):
-        self.points[i] = self.points[i] + offset
+        self._coords[i] += (offset.x(), offset.y())
+        self._invalidate()
 
     def highlightVertex(self, i, action):
         self._highlightIndex = i
@@ -180,9 +325,12 @@ class Shape(object):
     def highlightClear(self):
         self._highlightIndex = None
 
+    def isHighlighted(self):
+        return self._highlightIndex is not None
+
     def copy(self):
         shape = Shape("Copy of %s" % self.label)
-        shape.points = [p for p in self.points]
+        shape.coords = self._coords
         shape.fill = self.fill
         shape.selected = self.selected
         shape._closed = self._closed
@@ -193,10 +341,14 @@ class Shape(object):
         return shape
 
     def __len__(self):
-        return len(self.points)
+        return len(self._coords)
 
     def __getitem__(self, key):
-        return self.points[key]
+        if isinstance(key, slice):
+            return self.points[key]
+        x, y = self._coords[key]
+        return QPointF(x, y)
 
     def __setitem__(self, key, value):
-        self.points[key] = value
+        self._coords[key] = (value.x(), value.y())
+        self._invalidate()
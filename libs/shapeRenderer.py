@@ -0,0 +1,82 @@
+from collections import OrderedDict
+
+from PyQt4.QtGui import *
+from PyQt4.QtCore import *
+
+from shape import Shape
+from labelCache import labelCache
+
+
+class ShapeBatch(object):
+    """Combined paths of the shapes drawn with the same colors."""
+
+    def __init__(self, lineColor, fillColor):
+        self.lineColor = lineColor
+        self.fillColor = fillColor
+        self.lines = QPainterPath()
+        self.vertices = QPainterPath()
+        self.vertices.setFillRule(Qt.WindingFill)
+        self.fills = QPainterPath()
+        self.fills.setFillRule(Qt.WindingFill)
+        self.dots = QPolygonF()
+        self.labels = []
+
+    def add(self, shape, detail):
+        if detail == Shape.POINT_DETAIL:
+            self.dots.append(shape.boundingRect().center())
+            return
+        if detail == Shape.OUTLINE_DETAIL:
+            self.lines.addPath(shape.displayPath())
+        else:
+            self.lines.addPath(shape.linePath())
+            self.vertices.addPath(shape.vertexPath())
+        if shape.fill:
+            self.fills.addPolygon(shape.fillPolygon())
+            self.fills.closeSubpath()
+        if detail == Shape.FULL_DETAIL and shape.label is not None and \
+                shape.shape_type == Shape.RECT_SHAPE:
+            self.labels.append((shape[0], shape.label))
+
+    def paint(self, painter, width):
+        pen = QPen(self.lineColor)
+        pen.setWidth(width)
+        painter.setPen(pen)
+        painter.drawPath(self.lines)
+        if not self.vertices.isEmpty():
+            painter.drawPath(self.vertices)
+            painter.fillPath(self.vertices, Shape.vertex_fill_color)
+        if not self.fills.isEmpty():
+            painter.fillPath(self.fills, self.fillColor)
+        for point, label in self.labels:
+            labelCache.draw(painter, point, label)
+        if not self.dots.isEmpty():
+            pen.setWidthF(3.0 / Shape.scale)
+            painter.setPen(pen)
+            painter.drawPoints(self.dots)
+
+
+def paintShapes(painter, shapes):
+    """Draw (shape, detail) pairs as Shape.paint would, but with a handful
+    of draw calls for each combination of line and fill colors instead of
+    several per shape.
+
+    Shapes of the same style are drawn together, so their stacking order
+    is lost and their overlapping fills are filled once rather than
+    blended; shapes which have to stand out (selected, highlighted)
+    should be painted on their own afterwards."""
+    batches = OrderedDict()
+    for shape, detail in shapes:
+        if shape.selected:
+            lineColor = shape.select_line_color
+            fillColor = shape.select_fill_color
+        else:
+            lineColor, fillColor = shape.line_color, shape.fill_color
+        fillKey = fillColor.rgba() if shape.fill else None
+        key = (lineColor.rgba(), fillKey, shape.selected)
+        batch = batches.get(key)
+        if batch is None:
+            batch = batches[key] = ShapeBatch(lineColor, fillColor)
+        batch.add(shape, detail)
+    width = max(1, int(round(2.0 / Shape.scale)))
+    for batch in batches.itervalues():
+        batch.paint(painter, width)
@@ -0,0 +1,86 @@
+from math import floor
+
+
+class GridIndex(object):
+    """Uniform grid over the bounding boxes of shapes, so that hit-tests
+    only look at the shapes near a point.
+
+    Shapes are also numbered in insertion order, which is the order the
+    canvas paints them in, so queries can return the topmost first."""
+
+    def __init__(self, cellSize=128.0):
+        self.cellSize = float(cellSize)
+        self._cells = {}
+        self._shapeCells = {}
+        self._order = {}
+        self._counter = 0
+
+    def __contains__(self, shape):
+        return shape in self._shapeCells
+
+    def __len__(self):
+        return len(self._shapeCells)
+
+    def _cellRange(self, x1, y1, x2, y2):
+        size = self.cellSize
+        return [(cx, cy)
+                for cx in xrange(int(floor(x1 / size)), int(floor(x2 / size)) + 1)
+                for cy in xrange(int(floor(y1 / size)), int(floor(y2 / size)) + 1)]
+
+    def _place(self, shape):
+        rect = shape.boundingRect()
+        cells = self._cellRange(rect.left(), rect.top(),
+                                rect.right(), rect.bottom())
+        for cell in cells:
+            self._cells.setdefault(cell, set()).add(shape)
+        self._shapeCells[shape] = cells
+
+    def _unplace(self, shape):
+        for cell in self._shapeCells.pop(shape, ()):
+            bucket = self._cells[cell]
+            bucket.discard(shape)
+            if not bucket:
+                del self._cells[cell]
+
+    def insert(self, shape):
+        if shape in self._shapeCells:
+            self._unplace(shape)
+        else:
+            self._order[shape] = self._counter
+            self._counter += 1
+        self._place(shape)
+
+    def remove(self, shape):
+        self._unplace(shape)
+        self._order.pop(shape, None)
+
+    def update(self, shape):
+        """Re-file a shape after it moved; unknown shapes are ignored."""
+        if shape in self._shapeCells:
+            self._unplace(shape)
+            self._place(shape)
+
+    def clear(self):
+        self._cells.clear()
+        self._shapeCells.clear()
+        self._order.clear()
+        self._counter = 0
+
+    def rebuild(self, shapes, cellSize=None):
+        self.clear()
+        if cellSize is not None:
+            self.cellSize = float(cellSize)
+        for shape in shapes:
+            self.insert(shape)
+
+    def query(self, point, radius=0.0):
+        """Return the shapes whose bounding box, grown by radius, may
+        contain point, topmost first."""
+        x, y = point.x(), point.y()
+        found = set()
+        for cell in self._cellRange(x - radius, y - radius,
+                                    x + radius, y + radius):
+            bucket = self._cells.get(cell)
+            if bucket:
+                found.update(bucket)
+        return sorted(found, key=self._order.get, reverse=True)
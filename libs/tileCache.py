@@ -0,0 +1,140 @@
+import threading
+
+from PyQt4.QtGui import *
+from PyQt4.QtCore import *
+
+from imageCache import LRUCache, needsTiles, canDecodeRegions, \
+    decodeRegion
+
+TILE_SIZE = 512
+
+
+class TileTask(QRunnable):
+
+    def __init__(self, pyramid, key):
+        super(TileTask, self).__init__()
+        self.pyramid = pyramid
+        self.key = key
+
+    def run(self):
+        try:
+            # Skip tiles which scrolled out of view before their turn.
+            if self.pyramid.isWanted(self.key):
+                image = self.pyramid.decodeTile(*self.key)
+                if not image.isNull():
+                    self.pyramid.tileDecoded.emit(self.key, image)
+        finally:
+            self.pyramid.taskDone(self.key)
+
+
+class TilePyramid(QObject):
+    """Multi-resolution tiles of an image, decoded on demand.
+
+    Level n holds the image downscaled by 2 ** n, cut into tileSize
+    squares. Only the tiles intersecting the painted area are decoded
+    (with QImageReader clip rect and scaled size), and the decoded ones
+    are kept in a bounded LRU cache. Only formats which can decode
+    regions can be tiled (see canDecodeRegions): the others would be
+    decoded whole for every tile."""
+    tileDecoded = pyqtSignal(object, object)
+    tileLoaded = pyqtSignal()
+
+    def __init__(self, filename, imageSize, tileSize=TILE_SIZE,
+                 maxBytes=256 * 1024 * 1024, parent=None):
+        super(TilePyramid, self).__init__(parent)
+        self.filename = filename
+        self.imageSize = QSize(imageSize)
+        self.tileSize = tileSize
+        self.cache = LRUCache(maxBytes)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, QThread.idealThreadCount()))
+        self.maxLevel = 0
+        while max(self.imageSize.width(), self.imageSize.height()) > \
+                tileSize * 2 ** self.maxLevel:
+            self.maxLevel += 1
+        self._pending = set()
+        self._wanted = set()
+        self._lock = threading.Lock()
+        self.tileDecoded.connect(self.addTile)
+
+    def levelFor(self, scale):
+        """The coarsest level with at least the resolution of scale."""
+        level = 0
+        while level < self.maxLevel and scale * 2 ** (level + 1) <= 1.0:
+            level += 1
+        return level
+
+    def tileRect(self, level, col, row):
+        """Area of the image covered by a tile, in image coordinates."""
+        span = self.tileSize * 2 ** level
+        return QRect(col * span, row * span, span, span).intersected(
+            QRect(QPoint(0, 0), self.imageSize))
+
+    def decodeTile(self, level, col, row):
+        rect = self.tileRect(level, col, row)
+        factor = 2 ** level
+        return decodeRegion(self.filename, rect, QSize(
+            -(-rect.width() // factor), -(-rect.height() // factor)))
+
+    def isWanted(self, key):
+        with self._lock:
+            return key in self._wanted
+
+    def taskDone(self, key):
+        with self._lock:
+            self._pending.discard(key)
+
+    def addTile(self, key, image):
+        pixmap = QPixmap.fromImage(image)
+        self.cache.put(key, pixmap, pixmap.width() * pixmap.height() * 4)
+        self.tileLoaded.emit()
+
+    def request(self, keys):
+        with self._lock:
+            self._wanted = set(keys)
+            for key in keys:
+                if key not in self._pending:
+                    self._pending.add(key)
+                    self.pool.start(TileTask(self, key))
+
+    def cancel(self):
+        with self._lock:
+            self._wanted = set()
+
+    def paint(self, painter, exposed, scale):
+        """Draw the tiles intersecting exposed (in image coordinates) at
+        the level matching scale, queueing the missing ones. Until they
+        arrive, whatever coarser tile is cached is drawn instead."""
+        level = self.levelFor(scale)
+        span = self.tileSize * 2 ** level
+        cols = -(-self.imageSize.width() // span)
+        rows = -(-self.imageSize.height() // span)
+        firstCol = max(0, int(exposed.left() // span))
+        lastCol = min(cols - 1, int(exposed.right() // span))
+        firstRow = max(0, int(exposed.top() // span))
+        lastRow = min(rows - 1, int(exposed.bottom() // span))
+        missing = []
+        for row in xrange(firstRow, lastRow + 1):
+            for col in xrange(firstCol, lastCol + 1):
+                key = (level, col, row)
+                rect = QRectF(self.tileRect(*key))
+                pixmap = self.cache.get(key)
+                if pixmap is not None:
+                    painter.drawPixmap(rect, pixmap, QRectF(pixmap.rect()))
+                    continue
+                missing.append(key)
+                self.paintFallback(painter, rect, level)
+        self.request(missing)
+
+    def paintFallback(self, painter, rect, level):
+        for coarser in xrange(level + 1, self.maxLevel + 1):
+            span = self.tileSize * 2 ** coarser
+            key = (coarser, int(rect.left() // span), int(rect.top() // span))
+            pixmap = self.cache.get(key)
+            if pixmap is not None:
+                origin = QRectF(self.tileRect(*key)).topLeft()
+                factor = 2.0 ** coarser
+                source = QRectF((rect.topLeft() - origin) / factor,
+                                rect.size() / factor)
+                painter.drawPixmap(rect, pixmap, source)
+                return
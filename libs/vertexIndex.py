@@ -0,0 +1,125 @@
+import numpy as np
+
+
+class VertexIndex(object):
+    """The vertices of all the shapes in one coordinate array, so that
+    the vertices near a point are found with a single vectorized query.
+
+    Each shape owns a slot: a run of rows in the array. Moving the
+    vertices of a shape rewrites its rows in place; removed shapes leave
+    NaN rows behind until enough of them pile up to compact the array.
+    Like GridIndex, shapes are numbered in insertion (paint) order."""
+
+    def __init__(self):
+        self.clear()
+
+    def __contains__(self, shape):
+        return shape in self._slotOf
+
+    def __len__(self):
+        return len(self._slotOf)
+
+    def clear(self):
+        self._coords = np.empty((0, 2))
+        # Slot of every row.
+        self._rowSlots = np.empty(0, dtype=int)
+        # Per slot: shape (None once removed), first row, number of rows
+        # and paint order.
+        self._shapes = []
+        self._starts = []
+        self._sizes = []
+        self._orders = []
+        self._slotOf = {}
+        self._deadRows = 0
+        self._counter = 0
+
+    def _append(self, shapes, orders):
+        arrays = [self._coords]
+        slots = [self._rowSlots]
+        start = len(self._coords)
+        for shape, order in zip(shapes, orders):
+            slot = len(self._shapes)
+            coords = shape.coords
+            self._shapes.append(shape)
+            self._starts.append(start)
+            self._sizes.append(len(coords))
+            self._orders.append(order)
+            self._slotOf[shape] = slot
+            arrays.append(coords)
+            slots.append(np.repeat(slot, len(coords)))
+            start += len(coords)
+        self._coords = np.concatenate(arrays)
+        self._rowSlots = np.concatenate(slots)
+
+    def _kill(self, shape):
+        slot = self._slotOf.pop(shape)
+        start = self._starts[slot]
+        self._coords[start:start + self._sizes[slot]] = np.nan
+        self._shapes[slot] = None
+        self._deadRows += self._sizes[slot]
+
+    def _compact(self):
+        if self._deadRows * 2 <= len(self._coords):
+            return
+        live = [(order, shape) for shape, order
+                in zip(self._shapes, self._orders) if shape is not None]
+        live.sort()
+        counter = self._counter
+        self.clear()
+        self._counter = counter
+        self._append([shape for _, shape in live],
+                     [order for order, _ in live])
+
+    def insert(self, shape):
+        if shape in self._slotOf:
+            self.update(shape)
+            return
+        self._append([shape], [self._counter])
+        self._counter += 1
+
+    def remove(self, shape):
+        if shape in self._slotOf:
+            self._kill(shape)
+            self._compact()
+
+    def update(self, shape):
+        """Refresh the vertices of a shape after it changed; unknown
+        shapes are ignored."""
+        slot = self._slotOf.get(shape)
+        if slot is None:
+            return
+        coords = shape.coords
+        if len(coords) == self._sizes[slot]:
+            start = self._starts[slot]
+            self._coords[start:start + len(coords)] = coords
+            return
+        # The number of vertices changed: move the shape to a new slot.
+        order = self._orders[slot]
+        self._kill(shape)
+        self._append([shape], [order])
+        self._compact()
+
+    def rebuild(self, shapes):
+        self.clear()
+        shapes = list(shapes)
+        self._append(shapes, range(len(shapes)))
+        self._counter = len(shapes)
+
+    def query(self, point, radius):
+        """Return (shape, index) for the shapes having a vertex within
+        radius of point, topmost first. index is the first such vertex
+        of the shape, as Shape.nearestVertex would return."""
+        if not len(self._coords):
+            return []
+        d = np.hypot(self._coords[:, 0] - point.x(),
+                     self._coords[:, 1] - point.y())
+        # The rows of removed shapes are NaN, which never match.
+        with np.errstate(invalid='ignore'):
+            rows = np.flatnonzero(d <= radius)
+        hits = {}
+        for row in rows.tolist():
+            slot = int(self._rowSlots[row])
+            if slot not in hits:
+                hits[slot] = row - self._starts[slot]
+        slots = sorted(hits, key=self._orders.__getitem__, reverse=True)
+        return [(self._shapes[slot], hits[slot]) for slot in slots]
@@ -0,0 +1,179 @@
+#coding:utf-8
+'''
+benchmark the canvas: paint and hit-test latency as the number of shapes grows
+
+usage (from the repository root):
+    python scrips/bench_canvas.py --shapes 100 1000 5000
+
+Qt5 builds can run it without a display through the offscreen platform,
+which is selected by default; with Qt4 run it under xvfb-run instead.
+'''
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'libs'))
+
+from PyQt4.QtGui import *
+from PyQt4.QtCore import *
+
+from canvas import Canvas
+from shape import Shape
+
+
+class Quiet(object):
+    '''silence the prints of the code under test'''
+
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, *args):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+def make_pixmap(width, height):
+    image = QImage(width, height, QImage.Format_RGB32)
+    painter = QPainter(image)
+    gradient = QLinearGradient(0, 0, width, height)
+    gradient.setColorAt(0, QColor(40, 60, 90))
+    gradient.setColorAt(1, QColor(200, 180, 120))
+    painter.fillRect(image.rect(), QBrush(gradient))
+    painter.end()
+    return QPixmap.fromImage(image)
+
+
+def make_shapes(count, width, height, polygon_ratio, polygon_points, rng):
+    shapes = []
+    for i in xrange(count):
+        w = rng.uniform(8, width / 10.0)
+        h = rng.uniform(8, height / 10.0)
+        x = rng.uniform(0, width - w)
+        y = rng.uniform(0, height - h)
+        if rng.random() < polygon_ratio:
+            shape = Shape(label='object%d' % (i % 20), shape_type=1)
+            coords = []
+            for k in xrange(polygon_points):
+                angle = 2 * math.pi * k / polygon_points
+                r = rng.uniform(0.6, 1.0)
+                coords.append((x + w / 2 * (1 + r * math.cos(angle)),
+                               y + h / 2 * (1 + r * math.sin(angle))))
+            shape.coords = coords
+        else:
+            shape = Shape(label='object%d' % (i % 20), shape_type=0)
+            shape.coords = [(x, y), (x, y + h), (x + w, y + h), (x + w, y)]
+        shape.close()
+        shapes.append(shape)
+    return shapes
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return dict(p50=pick(0.5), p90=pick(0.9), p99=pick(0.99),
+                max=samples[-1], n=len(samples))
+
+
+def report(name, count, samples):
+    stats = percentiles(samples)
+    print '%-12s %7d  p50 %8.3f  p90 %8.3f  p99 %8.3f  max %8.3f ms  (n=%d)' % (
+        name, count, stats['p50'] * 1000, stats['p90'] * 1000,
+        stats['p99'] * 1000, stats['max'] * 1000, stats['n'])
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def bench(canvas, count, args, rng):
+    width, height = args.width, args.height
+    with Quiet():
+        shapes = make_shapes(count, width, height, args.polygons,
+                             args.polygon_points, rng)
+        canvas.loadShapes(shapes)
+
+    target = QPixmap(canvas.size())
+    full = QRegion(canvas.rect())
+    paint = [timed(canvas.render, target, QPoint(), full)
+             for _ in xrange(args.frames)]
+    report('paint', count, paint)
+
+    # Hit-testing, without the frame coalescing of mouseMoveEvent.
+    def widget_pos():
+        return QPointF(rng.uniform(0, canvas.width()),
+                       rng.uniform(0, canvas.height()))
+    hover = [timed(canvas.handleMouseMove,
+                   canvas.transformPos(widget_pos()), Qt.NoButton)
+             for _ in xrange(args.moves)]
+    report('hover', count, hover)
+
+    # Drag a few shapes around, repainting the damaged area as we go.
+    drag, dirty = [], []
+    for shape in rng.sample(shapes, min(len(shapes), args.drags)):
+        center = shape.boundingRect().center()
+        start = (center + canvas.offsetToCenter()) * canvas.scale
+        canvas.unHighlight()
+        with Quiet():
+            canvas.mousePressEvent(QMouseEvent(
+                QEvent.MouseButtonPress, start.toPoint(), Qt.LeftButton,
+                Qt.LeftButton, Qt.NoModifier))
+        pos = QPointF(start)
+        for _ in xrange(args.moves // max(1, args.drags)):
+            pos += QPointF(rng.uniform(-4, 4), rng.uniform(-4, 4))
+            rect = QRectF(canvas.shapeArea(canvas.selectedShape))
+            drag.append(timed(canvas.handleMouseMove,
+                              canvas.transformPos(pos), Qt.LeftButton))
+            area = rect.united(canvas.shapeArea(canvas.selectedShape))
+            offset = canvas.offsetToCenter()
+            region = QRectF((area.topLeft() + offset) * canvas.scale,
+                            (area.bottomRight() + offset) * canvas.scale)
+            dirty.append(timed(canvas.render, target, QPoint(),
+                               QRegion(region.toAlignedRect())))
+        canvas.mouseReleaseEvent(QMouseEvent(
+            QEvent.MouseButtonRelease, pos.toPoint(), Qt.LeftButton,
+            Qt.NoButton, Qt.NoModifier))
+    if drag:
+        report('drag', count, drag)
+        report('drag paint', count, dirty)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='canvas rendering benchmark')
+    parser.add_argument('--shapes', type=int, nargs='+',
+                        default=[100, 1000, 5000])
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--polygons', type=float, default=0.2,
+                        help='fraction of the shapes which are polygons')
+    parser.add_argument('--polygon-points', type=int, default=40)
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--moves', type=int, default=500)
+    parser.add_argument('--drags', type=int, default=5)
+    parser.add_argument('--view', default='1280x800',
+                        help='size of the canvas widget')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    canvas = Canvas()
+    canvas.resize(*[int(v) for v in args.view.split('x')])
+    canvas.loadPixmap(make_pixmap(args.width, args.height))
+    canvas.scale = min(float(canvas.width()) / args.width,
+                       float(canvas.height()) / args.height)
+    rng = random.Random(args.seed)
+    for count in args.shapes:
+        bench(canvas, count, args, rng)
+
+
+if __name__ == '__main__':
+    main()
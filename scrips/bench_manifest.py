@@ -0,0 +1,88 @@
+#coding:utf-8
+'''
+benchmark reopening a folder from its manifest: time until the first images
+are listed, and until the whole tree is
+
+the tree is made of empty directories, with the images only in a synthetic
+manifest, so a million images take no more than a thousand directories on
+disk.
+
+usage (from the repository root):
+    python scrips/bench_manifest.py --dirs 1000 --files 1000
+'''
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'libs'))
+
+from imageManifest import ImageManifest
+from imageScanner import iterImages
+
+
+def make_tree(root, dirs, files):
+    '''create the directories, and a manifest listing files images in each'''
+    names = ['d%06d' % i for i in xrange(dirs)]
+    for name in names:
+        os.mkdir(os.path.join(root, name))
+    entries = OrderedDict()
+    entries[root] = dict(mtime=os.stat(root).st_mtime, dirs=names, files=[])
+    for name in names:
+        path = os.path.join(root, name)
+        entries[path] = dict(
+            mtime=os.stat(path).st_mtime, dirs=[],
+            files=[['img%06d.jpg' % i, 123456, 1500000000.0, 0, 0, False]
+                   for i in xrange(files)])
+    path = os.path.join(root, 'tree.manifest.json')
+    manifest = ImageManifest(path)
+    # Kept in walk order, which is how a scan leaves the file.
+    manifest.dirs = entries
+    manifest.dirty = True
+    manifest.save()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='manifest reopen benchmark')
+    parser.add_argument('--dirs', type=int, default=1000)
+    parser.add_argument('--files', type=int, default=1000,
+                        help='images per directory')
+    parser.add_argument('--batch', type=int, default=1000,
+                        help='images in the first batch shown')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        root = os.path.join(tmpdir, 'images')
+        os.mkdir(root)
+        path = make_tree(root, args.dirs, args.files)
+        print 'manifest: %d images, %.1f MB' % (
+            args.dirs * args.files, os.path.getsize(path) / 1e6)
+
+        start = time.time()
+        manifest = ImageManifest(path)
+        manifest.load()
+        count = 0
+        first = batch = None
+        for _ in iterImages(root, listDir=manifest.listDir):
+            count += 1
+            if count == 1:
+                first = time.time() - start
+            if count == args.batch:
+                batch = time.time() - start
+        total = time.time() - start
+        print 'first image   %8.3f s' % first
+        if batch is not None:
+            print 'first %-7d %8.3f s' % (args.batch, batch)
+        print 'all %-9d %8.3f s' % (count, total)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
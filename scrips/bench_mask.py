@@ -0,0 +1,86 @@
+#coding:utf-8
+'''
+benchmark the mask writer: time to rasterize and encode a mask as the number
+of polygons grows, which should scale linearly
+
+usage (from the repository root):
+    python scrips/bench_mask.py --shapes 10 100 300 1000 --compress-level 6 1
+'''
+import argparse
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'libs'))
+
+from save_mask_image import label_mask_writer
+
+
+def make_shapes(count, width, height, polygon_points, labels, rng):
+    shapes = []
+    for i in xrange(count):
+        w = rng.uniform(8, width / 10.0)
+        h = rng.uniform(8, height / 10.0)
+        x = rng.uniform(0, width - w)
+        y = rng.uniform(0, height - h)
+        points = []
+        for k in xrange(polygon_points):
+            angle = 2 * math.pi * k / polygon_points
+            r = rng.uniform(0.6, 1.0)
+            points.append((x + w / 2 * (1 + r * math.cos(angle)),
+                           y + h / 2 * (1 + r * math.sin(angle))))
+        shapes.append(dict(label=labels[i % len(labels)], points=points))
+    return shapes
+
+
+def bench(path, shapes, args, label_num_dic, compress_level):
+    samples = []
+    for _ in xrange(args.repeat):
+        writer = label_mask_writer(label_num_dic, path, args.height,
+                                   args.width)
+        start = time.time()
+        writer.save_mask_image(shapes, compress_level=compress_level)
+        samples.append(time.time() - start)
+    best = min(samples)
+    print '%7d shapes  level %-4s  best %8.2f ms  %6.3f ms/shape  %7d bytes' % (
+        len(shapes), 'dflt' if compress_level is None else compress_level,
+        best * 1000, best * 1000 / max(1, len(shapes)), os.path.getsize(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='mask writer benchmark')
+    parser.add_argument('--shapes', type=int, nargs='+',
+                        default=[10, 100, 300, 1000])
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--polygon-points', type=int, default=40)
+    parser.add_argument('--labels', type=int, default=20)
+    parser.add_argument('--compress-level', type=int, nargs='+',
+                        default=[None, 1],
+                        help='png zlib levels to compare, 0-9')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    labels = ['object%d' % i for i in xrange(args.labels)]
+    label_num_dic = dict((label, i + 1) for i, label in enumerate(labels))
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'mask.png')
+        for count in args.shapes:
+            shapes = make_shapes(count, args.width, args.height,
+                                 args.polygon_points, labels, rng)
+            for level in args.compress_level:
+                bench(path, shapes, args, label_num_dic, level)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,44 +1,168 @@
 #coding:utf-8
+'''
+generate the mask images of a directory of annotation files on a process pool
+
+usage (from the repository root):
+    python scrips/generate_image.py Annotation/dir Mask/dir
+    python scrips/generate_image.py Annotation/dir Mask/dir \
+        --label-num-dic label_num_dic.json --processes 8 --compress-level 1
+
+each <name>.xml gives <output>/<name>_mask.png, drawn with the label numbers of
+label_num_dic.json (which labelImg writes next to the annotation files). masks
+newer than their annotation file are skipped unless --force is given.
+'''
+import argparse
 import json
 import os
+import sys
+import time
+from itertools import imap
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from libs import save_mask_image
-from libs.pascal_voc_io import PascalVocReader
+from libs.save_mask_image import label_mask_writer
+from libs.pascal_voc_io import readVocFile
+
+# set in each worker by init_worker
+_label_num_dic = None
+_compress_level = None
 
 
 def get_name_dic(file_path):
     with open(file_path) as infile:
-        label_num_dic = json.load(infile)
-        return label_num_dic
-        '''
-        items = infile.readlines()
-        index = 0
-        for item in items:
-            item = item.strip().split(' ')
-            for it in item:
-                label_num_dic[it] = index
-                index +=1
-                '''
-
-def get_image(filename,label_num_dic = None):
-    tVocParseReader = PascalVocReader(filename)
-    raw_shapes = tVocParseReader.getShapes()
-    print raw_shapes
-    def format_shape(s):
-        label,points,aa,bb,c = s
-        return dict(label=unicode(label),
-                    points=[(int(p[0]), int(p[1])) for p in points])
-
-    shapes = [format_shape(shape) for shape in raw_shapes]
-    image_size = tVocParseReader.get_img_size()
-    result_path = '/mask'+filename.split('/')[1].split('.')[0]+'.png'
-    mask_writer = save_mask_image.label_mask_writer(label_num_dic, result_path, image_size[0],
-                                                    image_size[1])
-    mask_writer.save_mask_image(shapes)
+        return json.load(infile)
+
+
+def mask_path(output_dir, xml_path):
+    name = os.path.splitext(os.path.basename(xml_path))[0]
+    return os.path.join(output_dir, name + '_mask.png')
+
+
+def is_stale(xml_path, result_path):
+    try:
+        return os.path.getmtime(result_path) < os.path.getmtime(xml_path)
+    except OSError:
+        return True
+
+
+def record_shapes(record):
+    shapes = []
+    for label, coords in record.objects:
+        if record.shape_type == 'RECT':
+            xmin, ymin, xmax, ymax = coords
+            points = [(xmin, ymin), (xmin, ymax), (xmax, ymax), (xmax, ymin)]
+        else:
+            points = zip(coords[::2], coords[1::2])
+        shapes.append(dict(label=unicode(label), points=points))
+    return shapes
+
+
+def init_worker(label_num_dic, compress_level):
+    global _label_num_dic, _compress_level
+    _label_num_dic = label_num_dic
+    _compress_level = compress_level
+
+
+def get_image(task):
+    '''
+    write the mask of one annotation file
+    :return: (xml path, 'written', 'empty' or 'error', error message)
+    '''
+    xml_path, result_path = task
+    # write next to the mask, so that an interrupted run never leaves a
+    # truncated mask which looks up to date
+    part_path = result_path + '.part'
+    try:
+        record = readVocFile(xml_path)
+        shapes = record_shapes(record)
+        if not shapes:
+            return xml_path, 'empty', None
+        # labelImg writes the image size swapped, its width into <height>
+        # and its height into <width>
+        mask_writer = label_mask_writer(_label_num_dic, part_path,
+                                        record.width, record.height)
+        mask_writer.save_mask_image(shapes, compress_level=_compress_level)
+        if os.name == 'nt' and os.path.exists(result_path):
+            os.remove(result_path)
+        os.rename(part_path, result_path)
+    except Exception as e:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return xml_path, 'error', '%s: %s' % (type(e).__name__, e)
+    return xml_path, 'written', None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='generate mask images from annotation files')
+    parser.add_argument('input_dir', help='directory of the .xml files')
+    parser.add_argument('output_dir', help='directory of the masks')
+    parser.add_argument('--label-num-dic',
+                        help='label to gray level json '
+                             '(default: input_dir/label_num_dic.json)')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per cpu)')
+    parser.add_argument('--chunksize', type=int, default=64)
+    parser.add_argument('--compress-level', type=int, default=None,
+                        help='png zlib level 0-9, lower is faster')
+    parser.add_argument('--force', action='store_true',
+                        help='rewrite the masks which are up to date')
+    parser.add_argument('--report-every', type=float, default=5.0,
+                        help='seconds between progress lines')
+    args = parser.parse_args()
+
+    label_num_dic = get_name_dic(args.label_num_dic or os.path.join(
+        args.input_dir, 'label_num_dic.json'))
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    start = time.time()
+    tasks = []
+    skipped = 0
+    for name in sorted(os.listdir(args.input_dir)):
+        if not name.lower().endswith('.xml'):
+            continue
+        xml_path = os.path.join(args.input_dir, name)
+        result_path = mask_path(args.output_dir, xml_path)
+        if args.force or is_stale(xml_path, result_path):
+            tasks.append((xml_path, result_path))
+        else:
+            skipped += 1
+    print '%d to generate, %d up to date' % (len(tasks), skipped)
+
+    counts = dict(written=0, empty=0, error=0)
+    pool = None
+    if args.processes == 1 or len(tasks) <= args.chunksize:
+        init_worker(label_num_dic, args.compress_level)
+        results = imap(get_image, tasks)
+    else:
+        pool = Pool(args.processes, init_worker,
+                    (label_num_dic, args.compress_level))
+        results = pool.imap_unordered(get_image, tasks, args.chunksize)
+    try:
+        begin = last = time.time()
+        for done, (xml_path, status, error) in enumerate(results, 1):
+            counts[status] += 1
+            if error is not None:
+                print >> sys.stderr, '%s: %s' % (xml_path, error)
+            now = time.time()
+            if now - last >= args.report_every:
+                last = now
+                print '%d/%d  %.1f files/s' % (
+                    done, len(tasks), done / (now - begin))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.time() - start
+    print '%d written, %d without shapes, %d failed, %d up to date ' \
+          'in %.1f s (%.1f files/s)' % (
+              counts['written'], counts['empty'], counts['error'], skipped,
+              elapsed, len(tasks) / max(elapsed, 1e-6))
+    return 1 if counts['error'] else 0
+
 
 if __name__ == '__main__':
-    file_list = os.listdir('img_addition')
-    print file_list
-    label_num_dic = get_name_dic('label_num_dic.json')
-    for file_name in file_list:
-        get_image('img_addition/'+file_name,label_num_dic)
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libs.editJournal import EditJournal
+
+
+class Coords(list):
+    """Stands in for the numpy array of Shape.coords."""
+
+    def tolist(self):
+        return [list(point) for point in self]
+
+
+class FakeShape(object):
+
+    def __init__(self, label, points, shape_type=0):
+        self.label = label
+        self.shape_type = shape_type
+        self.coords = Coords(points)
+
+
+def voc(label, points):
+    """A shape as read from an annotation file."""
+    return (label, points, None, None, 0)
+
+
+class EditJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'journal')
+        self.xml = os.path.join(self.dir, 'a.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def records(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def openImage(self, journal, image='a.jpg', xml=None, labels=('cat',)):
+        shapes = [FakeShape(label, [(0, 0), (1, 1)]) for label in labels]
+        journal.open(image, xml or self.xml, range(len(shapes)), shapes)
+        return shapes
+
+    def restart(self):
+        """A new journal on the file, as after a crash."""
+        journal = EditJournal(self.path)
+        found = journal.recover()
+        journal.restore()
+        return journal, found
+
+    def testTornLastLine(self):
+        journal = EditJournal(self.path)
+        shape, = self.openImage(journal)
+        shape.label = 'dog'
+        journal.relabel(shape)
+        journal.flush()
+        with open(self.path, 'a') as f:
+            f.write('{"t":"label","id":0,"la')
+        journal, found = self.restart()
+        self.assertEqual(found, ['a.jpg'])
+        ids, shapes = journal.replay('a.jpg', [voc('cat', [(0, 0), (1, 1)])])
+        self.assertEqual([shape[0] for shape in shapes], ['dog'])
+
+    def testMovesAreCoalesced(self):
+        journal = EditJournal(self.path)
+        first, second = self.openImage(journal, labels=('cat', 'dog'))
+        for x in (1, 2, 3):
+            first.coords = Coords([(x, x), (x + 1, x + 1)])
+            journal.move(first)
+        journal.flush()
+        moves = [r for r in self.records() if r['t'] == 'move']
+        self.assertEqual(moves, [{'t': 'move', 'id': 0,
+                                  'points': [[3, 3], [4, 4]]}])
+        # Only consecutive moves of the same shape are merged.
+        journal.move(second)
+        journal.move(first)
+        journal.flush()
+        moves = [r['id'] for r in self.records() if r['t'] == 'move']
+        self.assertEqual(moves, [0, 1, 0])
+
+    def testAddThenDelete(self):
+        journal = EditJournal(self.path)
+        self.openImage(journal)
+        added = FakeShape('bird', [(5, 5), (6, 6)])
+        journal.add(added)
+        journal.relabel(added)
+        journal.delete(added)
+        journal.flush()
+        journal, found = self.restart()
+        self.assertEqual(found, ['a.jpg'])
+        ids, shapes = journal.replay('a.jpg', [voc('cat', [(0, 0), (1, 1)])])
+        self.assertEqual(list(ids), [0])
+        self.assertEqual([shape[0] for shape in shapes], ['cat'])
+
+    def testReplayWhenAnnotationChanged(self):
+        journal = EditJournal(self.path)
+        shape, = self.openImage(journal)
+        shape.label = 'dog'
+        journal.relabel(shape)
+        journal.flush()
+        journal, found = self.restart()
+        self.assertEqual(journal.recoveredXml('a.jpg'), self.xml)
+        read = [voc('cat', [(0, 0), (1, 1)]), voc('cow', [(2, 2), (3, 3)])]
+        ids, shapes = journal.replay('a.jpg', read)
+        self.assertEqual(shapes, read)
+        self.assertTrue(journal.isDropped('a.jpg'))
+        # The edits which were not applied outlive the new sessions.
+        self.assertFalse(journal.open('a.jpg', self.xml, ids, []))
+        self.openImage(journal, 'b.jpg', os.path.join(self.dir, 'b.xml'))
+        journal.close()
+        self.assertTrue(os.path.isfile(self.path))
+        journal, found = self.restart()
+        self.assertEqual(found, ['a.jpg'])
+
+    def testReplayedEditsReachTheDisk(self):
+        journal = EditJournal(self.path)
+        shape, = self.openImage(journal)
+        shape.label = 'dog'
+        journal.relabel(shape)
+        journal.flush()
+        journal, found = self.restart()
+        ids, shapes = journal.replay('a.jpg', [voc('cat', [(0, 0), (1, 1)])])
+        self.assertTrue(journal.open('a.jpg', self.xml, ids,
+                                     [FakeShape('dog', [(0, 0), (1, 1)])]))
+        # Crash again without any flush.
+        journal, found = self.restart()
+        self.assertEqual(found, ['a.jpg'])
+        ids, shapes = journal.replay('a.jpg', [voc('cat', [(0, 0), (1, 1)])])
+        self.assertEqual([shape[0] for shape in shapes], ['dog'])
+
+    def testBackgroundSaveFinishingAfterEndSession(self):
+        journal = EditJournal(self.path)
+        shape, = self.openImage(journal)
+        shape.label = 'dog'
+        journal.relabel(shape)
+        journal.saving(self.xml)
+        journal.endSession()
+        self.openImage(journal, 'b.jpg', os.path.join(self.dir, 'b.xml'))
+        journal.flush()
+        # Until the save completes, its edits are recoverable.
+        self.assertEqual(EditJournal(self.path).recover(), ['a.jpg'])
+        journal.saved(self.xml)
+        self.assertEqual(EditJournal(self.path).recover(), [])
+        journal.close()
+        self.assertFalse(os.path.isfile(self.path))
+
+    def testCloseKeepsUnsavedSessions(self):
+        journal = EditJournal(self.path)
+        shape, = self.openImage(journal)
+        shape.label = 'dog'
+        journal.relabel(shape)
+        journal.saving(self.xml)
+        journal.close()
+        self.assertTrue(os.path.isfile(self.path))
+        journal, found = self.restart()
+        self.assertEqual(found, ['a.jpg'])
+
+    def testCloseRemovesSavedJournal(self):
+        journal = EditJournal(self.path)
+        shapes = self.openImage(journal)
+        shapes[0].label = 'dog'
+        journal.relabel(shapes[0])
+        journal.saved(self.xml, shapes)
+        journal.close()
+        self.assertFalse(os.path.isfile(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()